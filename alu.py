@@ -0,0 +1,74 @@
+# ALU result tables
+# every ADC/SBC outcome is precomputed, indexed by carry, accumulator and
+# operand: ADC[(c << 16) | (a << 8) | m]. Each entry is the 8-bit result
+# with the flags it sets (C, Z, V, N) in the high byte, so the operators do
+# one lookup:
+#   entry = ADC[index]; a = entry & 0xFF; p = (p & ~(C | Z | V | N)) | (entry >> 8)
+# binary SBC is ADC of the inverted operand, so it shares the ADC table.
+# the shift tables work the same way for one byte (and the carry, for the
+# rotates) with C, Z and N.
+#
+# decimal mode follows the NMOS 6502: for ADC, Z comes from the binary sum
+# and N and V from the sum after the low digit is adjusted; for SBC every
+# flag is the binary one and only the result is decimal adjusted.
+
+from array import array
+
+from status_reg import NZ, C, Z, V, N
+
+ALU_FLAGS = C | Z | V | N
+SHIFT_FLAGS = C | Z | N
+
+
+def adc_binary(a, m, c):
+    total = a + m + c
+    flags = NZ[total & 0xFF] | (total >> 8)
+    if ~(a ^ m) & (a ^ total) & 0x80:
+        flags |= V
+    return (total & 0xFF) | (flags << 8)
+
+
+def adc_decimal(a, m, c):
+    low = (a & 0x0F) + (m & 0x0F) + c
+    if low > 9:
+        low += 6
+    high = (a >> 4) + (m >> 4) + (low > 0x0F)
+    flags = (NZ[(high << 4) & 0xFF] & N) | (NZ[(a + m + c) & 0xFF] & Z)
+    if ~(a ^ m) & (a ^ (high << 4)) & 0x80:
+        flags |= V
+    if high > 9:
+        high += 6
+    if high > 0x0F:
+        flags |= C
+    return (((high << 4) | (low & 0x0F)) & 0xFF) | (flags << 8)
+
+
+def sbc_decimal(a, m, c):
+    flags = ADC[(c << 16) | (a << 8) | (m ^ 0xFF)] >> 8
+    low = (a & 0x0F) - (m & 0x0F) - (1 - c)
+    high = (a >> 4) - (m >> 4)
+    if low & 0x10:
+        low -= 6
+        high -= 1
+    if high & 0x10:
+        high -= 6
+    return (((high << 4) | (low & 0x0F)) & 0xFF) | (flags << 8)
+
+
+def table(function):
+    return array('H', [function(a, m, c) for c in (0, 1) for a in range(256) for m in range(256)])
+
+
+ADC = table(adc_binary)
+ADC_DECIMAL = table(adc_decimal)
+SBC_DECIMAL = table(sbc_decimal)
+
+ASL = array('H', [((value << 1) & 0xFF) | ((NZ[(value << 1) & 0xFF] | (value >> 7)) << 8)
+                  for value in range(256)])
+LSR = array('H', [(value >> 1) | ((NZ[value >> 1] | (value & C)) << 8)
+                  for value in range(256)])
+# rotates are indexed by (c << 8) | value
+ROL = array('H', [(((value << 1) | c) & 0xFF) | ((NZ[((value << 1) | c) & 0xFF] | (value >> 7)) << 8)
+                  for c in (0, 1) for value in range(256)])
+ROR = array('H', [((value >> 1) | (c << 7)) | ((NZ[(value >> 1) | (c << 7)] | (value & C)) << 8)
+                  for c in (0, 1) for value in range(256)])
@@ -0,0 +1,322 @@
+# lockstep batch emulation of many CPUs with NumPy
+# holds the registers of N CPUs in arrays and their memory in an (N, 65536)
+# uint8 array, and steps every lane one instruction at a time. Lanes sitting
+# on the same opcode are executed together with vector operations.
+#
+# the per-opcode vector code is made from the CPU's own methods: codegen
+# inlines them into straight-line statements and Vectorizer rewrites those
+# for arrays, turning each 'if' into a lane mask (np.where for assignments,
+# masked stores for writes). Lanes therefore end up in the same state as
+# the scalar engine would leave them in.
+#
+#   machine = batch.Batch.from_cpu(cpu, 4096)
+#   machine.ram[:, 0x0080] = np.arange(4096) & 0xFF    # per-lane inputs
+#   machine.run(cycles=100000)
+
+import array
+import ast
+
+import numpy as np
+
+import codegen
+import emulator
+
+# registers kept per lane; 'cycles' holds what reset()/clock() still owes
+REGISTERS = ('a', 'x', 'y', 'sp', 'pc', 'p', 'fetched', 'temp',
+             'address_absolute', 'address_relative')
+
+
+class Vectorizer:
+    # rewrites inlined scalar statements to run on arrays of lanes
+
+    def __init__(self):
+        self.masks = 0
+        self.assigned = set()   # method locals given a value so far
+
+    def block(self, statements, mask):
+        out = []
+        for stmt in statements:
+            out.extend(self.statement(stmt, mask))
+        return out
+
+    def statement(self, stmt, mask):
+        if isinstance(stmt, ast.Pass):
+            return []
+
+        if isinstance(stmt, ast.If):
+            test = call('truth', self.expr(stmt.test))
+            name = self.new_mask()
+            out = [assign(name, test if mask is None else and_(load(mask), test))]
+            out.extend(self.block(stmt.body, name))
+            if stmt.orelse:
+                other = self.new_mask()
+                inverse = call('np.logical_not', load(name))
+                out.append(assign(other, inverse if mask is None else and_(load(mask), inverse)))
+                out.extend(self.block(stmt.orelse, other))
+            return out
+
+        if isinstance(stmt, (ast.Assign, ast.AugAssign)):
+            target = stmt.targets[0] if isinstance(stmt, ast.Assign) else stmt.target
+            if isinstance(stmt, ast.Assign) and len(stmt.targets) != 1 \
+                    or not isinstance(target, ast.Name):
+                raise codegen.Unsupported('assignment')
+            value = self.expr(stmt.value)
+            if isinstance(stmt, ast.AugAssign):
+                value = ast.BinOp(load(target.id), stmt.op, value)
+            name = target.id
+            first = name not in codegen.REGISTERS and name not in self.assigned
+            self.assigned.add(name)
+            if mask is not None and not first:
+                # a method local first set under a mask is only used under it
+                value = call('np.where', load(mask), value, load(name))
+            return [assign(name, value)]
+
+        if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) \
+                and isinstance(stmt.value.func, ast.Name) and stmt.value.func.id == 'write':
+            args = [self.expr(arg) for arg in stmt.value.args]
+            if mask is not None:
+                args.append(load(mask))
+            return [ast.Expr(call('write', *args))]
+
+        raise codegen.Unsupported(type(stmt).__name__)
+
+    def expr(self, node):
+        return ast.fix_missing_locations(ExprRewriter().visit(node))
+
+    def new_mask(self):
+        self.masks += 1
+        return '_mask{}'.format(self.masks)
+
+
+class ExprRewriter(ast.NodeTransformer):
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return call('np.logical_not', call('truth', node.operand))
+        return node
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        func = 'np.logical_and' if isinstance(node.op, ast.And) else 'np.logical_or'
+        result = call('truth', node.values[0])
+        for value in node.values[1:]:
+            result = call(func, result, call('truth', value))
+        return result
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) > 1:
+            raise codegen.Unsupported('chained comparison')
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Name) and node.func.id in ('bool', 'int'):
+            return call('truth' if node.func.id == 'bool' else 'as_int', *node.args)
+        return node
+
+
+def load(name):
+    return ast.Name(name, ast.Load())
+
+
+def assign(name, value):
+    return ast.Assign([ast.Name(name, ast.Store())], value)
+
+
+def call(func, *args):
+    parts = func.split('.')
+    node = load(parts[0])
+    for part in parts[1:]:
+        node = ast.Attribute(node, part, ast.Load())
+    return ast.Call(node, list(args), [])
+
+
+def and_(left, right):
+    return call('np.logical_and', left, right)
+
+
+def truth(value):
+    return np.asarray(value) != 0
+
+
+def as_int(value):
+    return np.asarray(value).astype(np.int64)
+
+
+def generate(cls, opcode):
+    # source of a function op(machine, lanes) -> cycles for one opcode
+    compiled = codegen.compile_instruction(cls, opcode)
+    vectorized = Vectorizer().block(compiled.statements, None)
+    loaded, stored = codegen.used_registers(compiled.statements)
+    names = sorted((loaded | stored) & set(REGISTERS + ('halt',)))
+    stored = sorted(stored & set(REGISTERS + ('halt',)))
+
+    lines = ['def op_{:02X}(machine, lanes):'.format(opcode),
+             '    ram = machine.ram',
+             '    def read(address):',
+             '        return ram[lanes, np.bitwise_and(address, 0xFFFF)].astype(np.int64)',
+             '    def write(address, data, mask=None):',
+             '        store(ram, lanes, address, data, mask)']
+    lines.extend('    {0} = machine.{0}[lanes]'.format(name) for name in names)
+    lines.append('    cycles = {}'.format(compiled.instruction.cycles))
+    lines.extend('    ' + line for stmt in vectorized
+                 for line in ast.unparse(ast.fix_missing_locations(stmt)).splitlines())
+    lines.extend('    machine.{0}[lanes] = {0}'.format(name) for name in stored)
+    lines.append('    return cycles')
+    return '\n'.join(lines)
+
+
+def store(ram, lanes, address, data, mask):
+    address = np.broadcast_to(np.bitwise_and(address, 0xFFFF), lanes.shape)
+    data = np.broadcast_to(np.bitwise_and(data, 0xFF), lanes.shape)
+    if mask is None:
+        ram[lanes, address] = data
+    else:
+        mask = np.broadcast_to(mask, lanes.shape)
+        ram[lanes[mask], address[mask]] = data[mask]
+
+
+_tables = {}
+
+
+def build(cls):
+    # one vector function per opcode, None where the scalar methods must run
+    table = _tables.get(cls)
+    if table is None:
+        namespace = {}
+        for instruction in cls.lookup:
+            namespace.update(instruction.addr_mode.__globals__)
+            namespace.update(instruction.operator.__globals__)
+        # lookup tables (NZ, the alu tables) become arrays that take lane indices
+        for name, value in list(namespace.items()):
+            if isinstance(value, bytes):
+                namespace[name] = np.frombuffer(value, dtype=np.uint8).astype(np.int64)
+            elif isinstance(value, array.array):
+                namespace[name] = np.array(value, dtype=np.int64)
+        namespace.update(np=np, truth=truth, as_int=as_int, store=store)
+        table = []
+        for opcode in range(256):
+            try:
+                source = generate(cls, opcode)
+            except codegen.Unsupported:
+                table.append(None)
+                continue
+            code = {}
+            exec(compile(source, '<batch op {:02X}>'.format(opcode), 'exec'), dict(namespace), code)
+            function = code['op_{:02X}'.format(opcode)]
+            function.source = source
+            table.append(function)
+        _tables[cls] = table
+    return table
+
+
+class Batch:
+    def __init__(self, count, cpu_class=emulator.CPU):
+        self.count = count
+        self.cpu_class = cpu_class
+        self.ops = build(cpu_class)
+        self.ram = np.zeros((count, emulator.Bus.SIZE), dtype=np.uint8)
+        for name in REGISTERS:
+            setattr(self, name, np.zeros(count, dtype=np.int64))
+        self.opcode = np.zeros(count, dtype=np.int64)
+        self.cycles = np.zeros(count, dtype=np.int64)
+        self.clock_count = np.zeros(count, dtype=np.int64)
+        self.budget = np.zeros(count, dtype=np.int64)
+        self.halt = np.zeros(count, dtype=bool)
+        self.scalar = None      # CPU used for opcodes without vector code
+
+    @classmethod
+    def from_cpu(cls, cpu, count):
+        # every lane starts as a copy of cpu (registers and RAM)
+        machine = cls(count, type(cpu))
+        machine.ram[:] = np.frombuffer(cpu.bus.ram, dtype=np.uint8)
+        for name in REGISTERS + ('opcode', 'cycles', 'clock_count', 'budget', 'halt'):
+            getattr(machine, name)[:] = getattr(cpu, name)
+        return machine
+
+    def lane(self, index):
+        # a scalar CPU holding a copy of one lane's state
+        cpu = self.cpu_class()
+        cpu.bus.load(0, self.ram[index].tobytes())
+        for name in REGISTERS + ('opcode', 'cycles', 'clock_count', 'budget'):
+            setattr(cpu, name, int(getattr(self, name)[index]))
+        cpu.halt = bool(self.halt[index])
+        cpu.current_byte = cpu.lookup[cpu.opcode]
+        return cpu
+
+    def step(self, lanes=None):
+        # execute one instruction in each given lane (default: every running
+        # lane); returns the cycles each of them spent
+        if lanes is None:
+            lanes = np.flatnonzero(~self.halt)
+        spent = self.cycles[lanes].copy()
+        self.cycles[lanes] = 0
+        if not len(lanes):
+            return spent
+
+        pc = self.pc[lanes]
+        opcodes = self.ram[lanes, pc & 0xFFFF].astype(np.int64)
+        self.pc[lanes] = pc + 1
+        self.opcode[lanes] = opcodes
+
+        # group the lanes by opcode
+        order = np.argsort(opcodes, kind='stable')
+        sorted_ops = opcodes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ops[1:] != sorted_ops[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            positions = order[start:end]
+            group = lanes[positions]
+            function = self.ops[sorted_ops[start]]
+            if function is None:
+                spent[positions] += self.step_scalar(int(sorted_ops[start]), group)
+            else:
+                spent[positions] += function(self, group)
+
+        self.clock_count[lanes] += spent
+        return spent
+
+    def step_scalar(self, opcode, lanes):
+        # run the CPU methods one lane at a time, on a view of the lane's RAM
+        if self.scalar is None:
+            self.scalar = self.cpu_class()
+        cpu = self.scalar
+        instruction = cpu.lookup[opcode]
+        spent = np.zeros(len(lanes), dtype=np.int64)
+        for index, lane in enumerate(lanes):
+            cpu.bus.ram = memoryview(self.ram[lane])
+            for name in REGISTERS:
+                setattr(cpu, name, int(getattr(self, name)[lane]))
+            cpu.halt = bool(self.halt[lane])
+            cpu.opcode = opcode
+            cpu.current_byte = instruction
+            cpu.cycles = instruction.cycles
+            instruction.addr_mode(cpu)
+            instruction.operator(cpu)
+            for name in REGISTERS:
+                getattr(self, name)[lane] = getattr(cpu, name)
+            self.halt[lane] = cpu.halt
+            spent[index] = cpu.cycles
+        return spent
+
+    def run(self, cycles=None, instructions=None):
+        # like CPU.run() for every lane: each lane runs whole instructions
+        # until its own budget is used up or it halts
+        if cycles is None and instructions is None:
+            raise ValueError('run() needs cycles or instructions')
+        if cycles is not None:
+            self.budget += cycles
+        executed = 0
+        while instructions is None or executed < instructions:
+            running = ~self.halt
+            if cycles is not None:
+                running &= self.budget > 0
+            lanes = np.flatnonzero(running)
+            if not len(lanes):
+                break
+            spent = self.step(lanes)
+            if cycles is not None:
+                self.budget[lanes] -= spent
+            executed += 1
+        return executed
@@ -0,0 +1,25 @@
+# time creating and discarding many short-lived CPUs, the way the test farm does
+# usage: python benchmarks/construct.py [count]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import emulator as emu
+
+
+def bench(count):
+    start = time.perf_counter()
+    for _ in range(count):
+        cpu = emu.CPU()
+        cpu.reset()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    elapsed = bench(count)
+    print('{} CPUs in {:.3f}s  ({:.1f} us per CPU)'.format(
+        count, elapsed, elapsed / count * 1e6))
@@ -0,0 +1,49 @@
+# compare the reference interpreter (CPU.run) with the generated interpreter
+# (fastloop.run) on small guest loops
+# usage: python benchmarks/fastloop.py [cycles]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import emulator as emu
+import fastloop
+
+PROGRAMS = {
+    # main.py: LDA #$01 / ADC $01 / JMP $0002
+    'adc-loop': bytes([0xA9, 0x01, 0x65, 0x01, 0x4C, 0x02, 0x00]),
+    # LDX #$00 / INX / LDA $10,X / EOR #$55 / AND #$0F / CPX #$80 / BNE -11 / JMP $0000
+    'index-loop': bytes([0xA2, 0x00, 0xE8, 0xB5, 0x10, 0x49, 0x55, 0x29, 0x0F,
+                         0xE0, 0x80, 0xD0, 0xF5, 0x4C, 0x00, 0x00]),
+}
+
+
+def machine(program):
+    cpu = emu.CPU()
+    cpu.bus.load(0x0000, program)
+    cpu.bus.load(0xFFFC, bytes([0x00, 0x00]))
+    cpu.reset()
+    return cpu
+
+
+def bench(run, program, cycles):
+    cpu = machine(program)
+    start = time.perf_counter()
+    run(cpu, cycles)
+    return time.perf_counter() - start, cpu
+
+
+if __name__ == '__main__':
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fastloop.build(emu.CPU)     # don't time code generation
+
+    for name, program in PROGRAMS.items():
+        reference, ref_cpu = bench(lambda cpu, n: cpu.run(cycles=n), program, cycles)
+        generated, gen_cpu = bench(lambda cpu, n: fastloop.run(cpu, cycles=n), program, cycles)
+        same = (ref_cpu.a, ref_cpu.x, ref_cpu.p, ref_cpu.pc, ref_cpu.clock_count) == \
+            (gen_cpu.a, gen_cpu.x, gen_cpu.p, gen_cpu.pc, gen_cpu.clock_count)
+        print('{:12} reference {:6.2f} MHz   generated {:6.2f} MHz   speedup {:4.1f}x{}'.format(
+            name, cycles / reference / 1e6, cycles / generated / 1e6, reference / generated,
+            '' if same else '   STATE MISMATCH'))
@@ -0,0 +1,240 @@
+# benchmark suite: fixed 6502 workloads built in memory, run for a fixed
+# number of cycles, reported as emulated MHz, instructions/s and
+# ns/instruction, with an optional regression gate against a saved baseline.
+# Peak RSS is reported once for the whole run: it is a process high-water
+# mark, so it can't be split between workloads run in the same process
+#
+# usage:
+#   python benchmarks/suite.py                              # table
+#   python benchmarks/suite.py --json results.json          # also write JSON
+#   python benchmarks/suite.py --save-baseline base.json
+#   python benchmarks/suite.py --baseline base.json --tolerance 0.1
+#
+# with --baseline the exit status is 1 if any workload's MHz falls more than
+# the tolerance below the baseline. Each workload is timed --repeat times and
+# the best run counts.
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import emulator as emu
+
+OPCODE = {(name, mode): opcode for opcode, (name, mode, _) in enumerate(emu.OPCODES) if name != 'XXX'}
+SIZE = {'IMP': 1, 'IMM': 2, 'ZP0': 2, 'ZPX': 2, 'ZPY': 2, 'REL': 2,
+        'ABS': 3, 'ABX': 3, 'ABY': 3, 'IND': 3, 'IZX': 2, 'IZY': 2}
+
+
+def assemble(origin, program):
+    # program: 'label:' strings and (name, mode[, operand]) tuples; a label
+    # can stand in for an ABS operand or a branch target
+    labels = {}
+    address = origin
+    for item in program:
+        if isinstance(item, str):
+            labels[item.rstrip(':')] = address
+        else:
+            address += SIZE[item[1]]
+
+    code = bytearray()
+    for item in program:
+        if isinstance(item, str):
+            continue
+        name, mode = item[:2]
+        operand = labels.get(item[2], item[2]) if len(item) > 2 else 0
+        code.append(OPCODE[name, mode])
+        if mode == 'REL':
+            offset = operand - (origin + len(code) + 1)
+            if not -128 <= offset <= 127:
+                raise ValueError('branch to {!r} out of range'.format(item[2]))
+            code.append(offset & 0xFF)
+        elif SIZE[mode] == 2:
+            code.append(operand & 0xFF)
+        elif SIZE[mode] == 3:
+            code += operand.to_bytes(2, 'little')
+    return bytes(code)
+
+
+def machine(origin, program, data=()):
+    cpu = emu.CPU()
+    cpu.bus.load(origin, assemble(origin, program))
+    for address, block in data:
+        cpu.bus.load(address, block)
+    cpu.bus.load(0xFFFC, origin.to_bytes(2, 'little'))
+    cpu.reset()
+    return cpu
+
+
+def adc_loop():
+    # main.py: LDA #$01 / ADC $01 / JMP $0002
+    return machine(0x0000, [('LDA', 'IMM', 0x01), 'loop:', ('ADC', 'ZP0', 0x01), ('JMP', 'ABS', 'loop')])
+
+
+def memory_copy():
+    # copy $1000-$10FF to $2000-$20FF, forever
+    source = bytes(random.Random(1).randrange(256) for _ in range(256))
+    return machine(0x0200, [
+        'start:', ('LDX', 'IMM', 0x00),
+        'loop:', ('LDA', 'ABX', 0x1000), ('STA', 'ABX', 0x2000), ('INX', 'IMP'), ('BNE', 'REL', 'loop'),
+        ('JMP', 'ABS', 'start'),
+    ], [(0x1000, source)])
+
+
+def multiply():
+    # 16 x 16 -> 32 bit shift-and-add multiply of $1234 by $ABCD into $14-$17
+    return machine(0x0200, [
+        'start:',
+        ('LDA', 'IMM', 0x34), ('STA', 'ZP0', 0x10), ('LDA', 'IMM', 0x12), ('STA', 'ZP0', 0x11),
+        ('LDA', 'IMM', 0xCD), ('STA', 'ZP0', 0x12), ('LDA', 'IMM', 0xAB), ('STA', 'ZP0', 0x13),
+        ('LDA', 'IMM', 0x00), ('STA', 'ZP0', 0x16), ('STA', 'ZP0', 0x17),
+        ('LDX', 'IMM', 16),
+        'bit:', ('LSR', 'ZP0', 0x11), ('ROR', 'ZP0', 0x10), ('BCC', 'REL', 'shift'),
+        ('CLC', 'IMP'),
+        ('LDA', 'ZP0', 0x16), ('ADC', 'ZP0', 0x12), ('STA', 'ZP0', 0x16),
+        ('LDA', 'ZP0', 0x17), ('ADC', 'ZP0', 0x13), ('STA', 'ZP0', 0x17),
+        'shift:', ('ROR', 'ZP0', 0x17), ('ROR', 'ZP0', 0x16), ('ROR', 'ZP0', 0x15), ('ROR', 'ZP0', 0x14),
+        ('DEX', 'IMP'), ('BNE', 'REL', 'bit'),
+        ('JMP', 'ABS', 'start'),
+    ])
+
+
+def bubble_sort():
+    # copy 32 shuffled bytes from $1000 to $2000 and bubble sort them, forever
+    values = list(range(0, 256, 8))
+    random.Random(2).shuffle(values)
+    return machine(0x0200, [
+        'start:', ('LDX', 'IMM', 31),
+        'copy:', ('LDA', 'ABX', 0x1000), ('STA', 'ABX', 0x2000), ('DEX', 'IMP'), ('BPL', 'REL', 'copy'),
+        'pass:', ('LDY', 'IMM', 0), ('STY', 'ZP0', 0x20), ('LDX', 'IMM', 0),
+        'compare:', ('LDA', 'ABX', 0x2000), ('CMP', 'ABX', 0x2001),
+        ('BCC', 'REL', 'next'), ('BEQ', 'REL', 'next'),
+        ('TAY', 'IMP'), ('LDA', 'ABX', 0x2001), ('STA', 'ABX', 0x2000), ('TYA', 'IMP'), ('STA', 'ABX', 0x2001),
+        ('LDA', 'IMM', 1), ('STA', 'ZP0', 0x20),
+        'next:', ('INX', 'IMP'), ('CPX', 'IMM', 31), ('BNE', 'REL', 'compare'),
+        ('LDA', 'ZP0', 0x20), ('BNE', 'REL', 'pass'),
+        ('JMP', 'ABS', 'start'),
+    ], [(0x1000, bytes(values))])
+
+
+def zero_page_checksum():
+    # add/rotate/xor checksum over the zero page, stored at $02
+    table = bytes(random.Random(3).randrange(256) for _ in range(256))
+    return machine(0x0200, [
+        'start:', ('LDA', 'IMM', 0), ('LDX', 'IMM', 0x7F), ('CLC', 'IMP'),
+        'loop:', ('ADC', 'ZPX', 0x80), ('ROL', 'IMP'), ('EOR', 'ZPX', 0x00),
+        ('DEX', 'IMP'), ('BPL', 'REL', 'loop'),
+        ('STA', 'ZP0', 0x02), ('JMP', 'ABS', 'start'),
+    ], [(0x0003, table[3:])])
+
+
+WORKLOADS = {
+    'adc-loop': adc_loop,
+    'memory-copy': memory_copy,
+    'multiply-16': multiply,
+    'bubble-sort': bubble_sort,
+    'zp-checksum': zero_page_checksum,
+}
+
+
+def engine_runner(engine):
+    # run(cpu, cycles) -> instructions executed
+    if engine == 'interpreter':
+        return lambda cpu, cycles: cpu.run(cycles=cycles)
+    if engine == 'fastloop':
+        import fastloop
+        fastloop.build(emu.CPU)     # don't time code generation
+        return lambda cpu, cycles: fastloop.run(cpu, cycles=cycles)
+    raise ValueError('unknown engine {!r}'.format(engine))
+
+
+def bench(build, run, cycles, repeat):
+    best = None
+    for _ in range(repeat):
+        cpu = build()
+        start = time.perf_counter()
+        instructions = run(cpu, cycles)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, instructions, cpu.clock_count)
+    seconds, instructions, clock_count = best
+    return {
+        'seconds': seconds,
+        'cycles': clock_count,
+        'instructions': instructions,
+        'mhz': clock_count / seconds / 1e6,
+        'instructions_per_second': instructions / seconds,
+        'ns_per_instruction': seconds / instructions * 1e9,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # names of the workloads that are slower than the baseline allows
+    slower = []
+    for name, result in results['workloads'].items():
+        reference = baseline['workloads'].get(name)
+        if reference is not None and result['mhz'] < reference['mhz'] * (1 - tolerance):
+            slower.append(name)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='emulator throughput benchmarks')
+    parser.add_argument('--cycles', type=int, default=2000000, help='cycles per workload run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--engine', default='interpreter', choices=('interpreter', 'fastloop'))
+    parser.add_argument('--only', action='append', choices=sorted(WORKLOADS), help='run just these')
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--save-baseline', help='write the results here as the new baseline')
+    parser.add_argument('--baseline', help='compare against this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown against the baseline (default 0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    run = engine_runner(args.engine)
+    results = {
+        'engine': args.engine,
+        'cycles': args.cycles,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'workloads': {},
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print('{:14} {:>8} {:>12} {:>8}  {}'.format('workload', 'MHz', 'instr/s', 'ns/inst',
+                                              'vs baseline' if baseline else '').rstrip())
+    for name in args.only or WORKLOADS:
+        result = results['workloads'][name] = bench(WORKLOADS[name], run, args.cycles, args.repeat)
+        change = ''
+        if baseline and name in baseline['workloads']:
+            change = '{:+.1%}'.format(result['mhz'] / baseline['workloads'][name]['mhz'] - 1)
+        print('{:14} {:8.3f} {:12,.0f} {:8.0f}  {}'.format(
+            name, result['mhz'], result['instructions_per_second'], result['ns_per_instruction'],
+            change).rstrip())
+    results['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print('peak RSS {} KiB'.format(results['peak_rss_kb']))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if baseline:
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print('slower than baseline by more than {:.0%}: {}'.format(args.tolerance, ', '.join(slower)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
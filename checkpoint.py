@@ -0,0 +1,71 @@
+# delta checkpoints
+# streams machine state to a file as a series of records, each holding the
+# registers and only the RAM pages written since the previous record (the
+# first record holds every page). Built on the bus dirty-page tracking.
+#
+#   writer = checkpoint.DeltaWriter(cpu, open('run.ckpt', 'wb'))
+#   ...  writer.checkpoint()  every few thousand instructions  ...
+#   checkpoint.restore(cpu, open('run.ckpt', 'rb'), index)
+#
+# record: register header (emulator.SNAPSHOT), page count (uint16), then
+# for each page its number (uint8) and its 256 bytes
+
+import struct
+
+import emulator
+
+COUNT = struct.Struct('<H')
+PAGE = 256
+
+
+class DeltaWriter:
+    def __init__(self, cpu, f):
+        self.cpu = cpu
+        self.f = f
+        self.records = 0
+        if cpu.bus.dirty is None:
+            cpu.bus.track_writes()
+
+    def checkpoint(self):
+        # append a record and return the number of pages it holds
+        bus = self.cpu.bus
+        pages = bus.checkpoint()
+        if self.records == 0:
+            pages = [(page, bus.dump(page * PAGE, PAGE)) for page in range(256)]
+
+        parts = [self.cpu.save_registers(), COUNT.pack(len(pages))]
+        for page, data in pages:
+            parts.append(bytes((page,)))
+            parts.append(data)
+        self.f.write(b''.join(parts))
+        self.records += 1
+        return len(pages)
+
+
+def read_checkpoints(f):
+    # yields (register header, [(page, bytes), ...]) for each record
+    while True:
+        header = f.read(emulator.SNAPSHOT.size)
+        if not header:
+            return
+        count, = COUNT.unpack(f.read(COUNT.size))
+        data = f.read(count * (PAGE + 1))
+        pages = [(data[i], data[i + 1:i + 1 + PAGE]) for i in range(0, len(data), PAGE + 1)]
+        yield header, pages
+
+
+def restore(cpu, f, index=-1):
+    # put cpu in the state of record index (negative counts from the end)
+    records = []
+    for record in read_checkpoints(f):
+        records.append(record)
+    if not records:
+        raise ValueError('no checkpoints in file')
+    index %= len(records)
+
+    memory = bytearray(emulator.Bus.SIZE)
+    for header, pages in records[:index + 1]:
+        for page, data in pages:
+            memory[page * PAGE:(page + 1) * PAGE] = data
+    cpu.load_registers(records[index][0])
+    cpu.bus.load(0, memory)
@@ -0,0 +1,239 @@
+# turns the CPU's addressing-mode and operator methods into straight-line
+# Python source, so the block translator and the generated interpreter run
+# exactly the same code as CPU.step() without a method call per instruction.
+#
+# each method body is parsed once and rewritten:
+#   self.<register>          -> local variable <register>
+#   self.read(..) / write(..) -> read(..) / write(..)
+#   self.fetch() and friends -> the called method's body, inlined
+#   self.current_byte.mode   -> the addressing mode being compiled
+#   method locals            -> _<name>, so they can't clash with registers
+# and when the address of the instruction is known, the operand reads
+# (self.read(self.pc)) are replaced by the operand bytes themselves.
+
+import ast
+import copy
+import inspect
+import textwrap
+
+REGISTERS = ('a', 'x', 'y', 'sp', 'pc', 'p', 'fetched', 'temp',
+             'address_absolute', 'address_relative', 'cycles', 'halt')
+
+# operators that move pc themselves and so end a run of straight-line code
+ENDS_BLOCK = frozenset(('BCC', 'BCS', 'BEQ', 'BMI', 'BNE', 'BPL', 'BVC', 'BVS',
+                        'JMP', 'JSR', 'RTS', 'RTI', 'BRK'))
+
+
+class Unsupported(Exception):
+    # the method does something the inliner can't express as local code
+    pass
+
+
+_bodies = {}
+
+
+def method_body(func):
+    # a fresh copy of the parsed body; the transformers below edit it in place
+    body = _bodies.get(func)
+    if body is None:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+        body = _bodies[func] = tree.body[0].body
+    return copy.deepcopy(body)
+
+
+def is_self(node):
+    return isinstance(node, ast.Name) and node.id == 'self'
+
+
+def self_attr(node):
+    # 'name' for self.name, 'bus.name' for self.bus.name, else None
+    if isinstance(node, ast.Attribute):
+        if is_self(node.value):
+            return node.attr
+        if isinstance(node.value, ast.Attribute) and is_self(node.value.value):
+            return node.value.attr + '.' + node.attr
+    return None
+
+
+def assigns(stmt, register):
+    for node in ast.walk(stmt):
+        if isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store) \
+                and self_attr(node) == register:
+            return True
+    return False
+
+
+def overwrites_pc(stmt):
+    # self.pc = <expression not involving pc>
+    return isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 \
+        and self_attr(stmt.targets[0]) == 'pc' \
+        and not any(self_attr(node) == 'pc' for node in ast.walk(stmt.value))
+
+
+def local_names(body):
+    names = set()
+    for stmt in body:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                names.add(node.id)
+    return names
+
+
+class Inliner(ast.NodeTransformer):
+    def __init__(self, cls, mode, locals_, pc=None, code=None):
+        self.cls = cls
+        self.mode = mode
+        self.locals = locals_
+        self.pc = pc            # address of the next byte, when known
+        self.code = code        # code(address) -> byte, for baked operands
+
+    def visit_Expr(self, node):
+        # self.method() as a statement: inline the method's body
+        call = node.value
+        if isinstance(call, ast.Call) and not call.args and not call.keywords:
+            name = self_attr(call.func)
+            if name is not None and '.' not in name and name not in ('read', 'write'):
+                func = getattr(self.cls, name, None)
+                if not inspect.isfunction(func):
+                    raise Unsupported(name)
+                body = method_body(func)
+                inliner = Inliner(self.cls, self.mode, local_names(body), self.pc, self.code)
+                out = []
+                for stmt in body:
+                    result = inliner.visit(stmt)
+                    out.extend(result if isinstance(result, list) else [result])
+                return out
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        name = self_attr(node.func)
+        if name in ('read', 'bus.read'):
+            if self.pc is not None and len(node.args) == 1 and self_attr(node.args[0]) == 'pc':
+                return ast.Constant(self.code(self.pc))
+            return ast.Call(ast.Name('read', ast.Load()),
+                            [self.visit(arg) for arg in node.args], [])
+        if name in ('write', 'bus.write'):
+            return ast.Call(ast.Name('write', ast.Load()),
+                            [self.visit(arg) for arg in node.args], [])
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        name = self_attr(node)
+        if name == 'current_byte.mode':
+            return ast.Constant(self.mode)
+        if name in REGISTERS:
+            if name == 'pc' and self.pc is not None and isinstance(node.ctx, ast.Load):
+                return ast.Constant(self.pc)
+            return ast.Name(name, node.ctx)
+        if name is not None:
+            raise Unsupported(name)
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id == 'self':
+            raise Unsupported('self')
+        if node.id in self.locals:
+            return ast.Name('_' + node.id, node.ctx)
+        return node
+
+
+class Folder(ast.NodeTransformer):
+    # folds the constant tests left behind by inlining and drops no-op
+    # 'cycles += 0' statements
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        operands = [node.left] + node.comparators
+        if all(isinstance(operand, ast.Constant) for operand in operands):
+            expr = ast.fix_missing_locations(ast.Expression(node))
+            return ast.Constant(eval(compile(expr, '<fold>', 'eval')))
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not) and isinstance(node.operand, ast.Constant):
+            return ast.Constant(not node.operand.value)
+        return node
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant):
+            return (node.body if node.test.value else node.orelse) or []
+        if not node.body:
+            node.body = [ast.Pass()]
+        return node
+
+    def visit_AugAssign(self, node):
+        self.generic_visit(node)
+        if isinstance(node.target, ast.Name) and node.target.id == 'cycles' \
+                and isinstance(node.value, ast.Constant) and node.value.value == 0:
+            return None
+        return node
+
+
+class Compiled:
+    __slots__ = ('opcode', 'instruction', 'statements', 'next_pc', 'ends_block', 'writes')
+
+    def source(self, indent):
+        pad = ' ' * indent
+        lines = []
+        for stmt in self.statements:
+            lines.extend(pad + line for line in ast.unparse(stmt).splitlines())
+        return lines
+
+
+def compile_instruction(cls, opcode, pc=None, code=None):
+    # inline one opcode of cls.lookup. With pc (the address just past the
+    # opcode byte) and code(address) -> byte given, operand bytes are baked
+    # in and next_pc is the static address of the following instruction
+    # (None once the instruction has moved pc itself).
+    # Raises Unsupported if the methods can't be inlined.
+    instruction = cls.lookup[opcode]
+    statements = []
+    known = pc
+
+    for func in (instruction.addr_mode, instruction.operator):
+        body = method_body(func)
+        inliner = Inliner(cls, instruction.mode, local_names(body), known, code)
+        for stmt in body:
+            if known is not None:
+                if isinstance(stmt, ast.AugAssign) and self_attr(stmt.target) == 'pc' \
+                        and isinstance(stmt.op, ast.Add) and isinstance(stmt.value, ast.Constant):
+                    known += stmt.value.value
+                    inliner.pc = known
+                    continue
+                if assigns(stmt, 'pc'):
+                    if not overwrites_pc(stmt):
+                        statements.append(ast.parse('pc = {}'.format(known)).body[0])
+                    known = inliner.pc = None
+            result = inliner.visit(stmt)
+            statements.extend(result if isinstance(result, list) else [result])
+
+    folder = Folder()
+    folded = []
+    for stmt in statements:
+        result = folder.visit(stmt)
+        if result is not None:
+            folded.extend(result if isinstance(result, list) else [result])
+
+    compiled = Compiled()
+    compiled.opcode = opcode
+    compiled.instruction = instruction
+    compiled.statements = [ast.fix_missing_locations(stmt) for stmt in folded]
+    compiled.next_pc = known
+    compiled.ends_block = known is None or instruction.name in ENDS_BLOCK
+    compiled.writes = any(isinstance(node, ast.Name) and node.id == 'write'
+                          for stmt in folded for node in ast.walk(stmt))
+    return compiled
+
+
+def used_registers(statements):
+    loaded, stored = set(), set()
+    for stmt in statements:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Name) and node.id in REGISTERS:
+                (stored if isinstance(node.ctx, ast.Store) else loaded).add(node.id)
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name) \
+                    and node.target.id in REGISTERS:
+                loaded.add(node.target.id)
+    return loaded, stored
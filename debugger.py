@@ -0,0 +1,166 @@
+# breakpoints, watchpoints and conditional breaks
+# execution breakpoints are a dict keyed by pc, checked once per instruction
+# with a single lookup. Watchpoints are flags in a 64K bitmap; only the
+# pages holding a watched address get a read handler in the bus page table
+# or a write hook, so every other page keeps its fast path. Conditions are
+# Python predicates called with the CPU, e.g.
+#
+#   dbg = debugger.Debugger(cpu)
+#   dbg.add_breakpoint(0x1234)
+#   dbg.add_breakpoint(0x2000, lambda cpu: cpu.x == 3)
+#   dbg.add_watchpoint(0xD400, 0xD4FF, read=True)
+#   dbg.add_condition(lambda cpu: cpu.status.D)
+#   reason = dbg.run(cycles=1000000)    # ('breakpoint', pc), ('write', address, data), ...
+#
+# with nothing set, run() is CPU.run(). Otherwise it steps on the
+# interpreter and stops after the instruction that hit a watchpoint or
+# condition, or before an instruction at a breakpoint. A watched read fires
+# for data reads only, not for fetching the instruction's own opcode and
+# operand bytes.
+
+from disassembler import OPERAND_LENGTH
+
+READ = 1
+WRITE = 2
+
+
+class Debugger:
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.breakpoints = {}       # pc -> condition, or None to always break
+        self.conditions = []
+        self.watch = bytearray(0x10000)     # READ | WRITE flags per address
+        self.page_watches = [0] * 256       # watched addresses per page
+        self.read_handlers = {}     # page -> handler it had before watching reads
+        self.watched = 0            # addresses with any watch flag
+        self.hits = []              # filled only while run() is stepping
+        self.recording = False
+        self.fetching = (0, 0)      # bytes of the instruction being executed
+        self.lengths = bytes(1 + OPERAND_LENGTH[instruction.mode] for instruction in cpu.lookup)
+        self.resume_pc = None       # breakpoint last stopped at, passed on resuming
+
+    def add_breakpoint(self, pc, condition=None):
+        self.breakpoints[pc & 0xFFFF] = condition
+
+    def remove_breakpoint(self, pc):
+        self.breakpoints.pop(pc & 0xFFFF, None)
+
+    def add_condition(self, predicate):
+        self.conditions.append(predicate)
+
+    def remove_condition(self, predicate):
+        self.conditions.remove(predicate)
+
+    def add_watchpoint(self, start, end=None, read=False, write=True):
+        # watch start..end inclusive
+        flags = (READ if read else 0) | (WRITE if write else 0)
+        for address in range(start, (start if end is None else end) + 1):
+            self.set_watch(address, self.watch[address] | flags)
+
+    def remove_watchpoint(self, start, end=None):
+        for address in range(start, (start if end is None else end) + 1):
+            self.set_watch(address, 0)
+
+    def set_watch(self, address, flags):
+        page = address >> 8
+        old = self.watch[address]
+        self.watch[address] = flags
+        self.watched += bool(flags) - bool(old)
+        reads = self.page_watches[page]
+        self.page_watches[page] += bool(flags & READ) - bool(old & READ)
+        if not reads and self.page_watches[page]:
+            self.watch_reads(page)
+        elif reads and not self.page_watches[page]:
+            self.cpu.bus.read_pages[page] = self.read_handlers.pop(page)
+
+        bus = self.cpu.bus
+        if flags & WRITE and not old & WRITE:
+            bus.add_write_hook(page, self.written)
+        elif old & WRITE and not flags & WRITE:
+            start = page << 8
+            if not any(flag & WRITE for flag in self.watch[start:start + 256]):
+                bus.remove_write_hook(page, self.written)
+
+    def watch_reads(self, page):
+        bus = self.cpu.bus
+        ram = bus.ram
+        watch = self.watch
+        hits = self.hits
+        handler = self.read_handlers[page] = bus.read_pages[page]
+
+        def watched_read(address):
+            data = ram[address] if handler is None else handler(address)
+            if watch[address] & READ and self.recording:
+                start, end = self.fetching
+                if not start <= address < end:
+                    hits.append(('read', address, data))
+            return data
+
+        bus.read_pages[page] = watched_read
+
+    def written(self, address, data):
+        if self.watch[address] & WRITE and self.recording:
+            self.hits.append(('write', address, data))
+
+    def active(self):
+        return bool(self.breakpoints or self.conditions or self.watched)
+
+    def run(self, cycles=None, instructions=None):
+        # CPU.run() that stops early on a hit; returns the reason, or None if
+        # the budget ran out or the CPU halted. Resuming from a breakpoint
+        # executes the instruction there before checking again.
+        cpu = self.cpu
+        resume_pc, self.resume_pc = self.resume_pc, None
+        if not self.active():
+            cpu.run(cycles, instructions)
+            return None
+        if cycles is None and instructions is None:
+            raise ValueError('run() needs cycles or instructions')
+
+        step = cpu.stepper()
+        breakpoints = self.breakpoints
+        conditions = self.conditions
+        hits = self.hits
+        del hits[:]
+        ram = cpu.bus.ram
+        lengths = self.lengths
+        budget = cpu.budget + cycles if cycles is not None else 1
+        executed = 0
+        reason = None
+        # the watch hooks stay installed between runs but only record while
+        # this loop is there to check them
+        self.recording = True
+        try:
+            while budget > 0 and not cpu.halt and (instructions is None or executed < instructions):
+                if cpu.pc in breakpoints and not (executed == 0 and cpu.pc == resume_pc):
+                    condition = breakpoints[cpu.pc]
+                    if condition is None or condition(cpu):
+                        reason = ('breakpoint', cpu.pc)
+                        self.resume_pc = cpu.pc
+                        break
+                pc = cpu.pc & 0xFFFF
+                self.fetching = (pc, pc + lengths[ram[pc]])
+                spent = step()
+                if cycles is not None:
+                    budget -= spent
+                executed += 1
+                if hits:
+                    reason = hits[0]
+                    break
+                for predicate in conditions:
+                    if predicate(cpu):
+                        reason = ('condition', predicate)
+                        break
+                if reason is not None:
+                    break
+        finally:
+            self.recording = False
+        if cycles is not None:
+            cpu.budget = budget
+        return reason
+
+    def step(self):
+        # one instruction, even one sitting on a breakpoint; returns the
+        # watchpoint or condition it hit, if any
+        self.resume_pc = self.cpu.pc
+        return self.run(instructions=1)
@@ -0,0 +1,188 @@
+# disassembler and static code-flow analysis
+# decodes memory with the CPU's own decode table (names, addressing modes)
+# and caches every decoded instruction by address. A bus write hook on each
+# page holding cached instructions drops the ones whose bytes are written,
+# so a decode is only redone after the code changes. Decoding reads RAM
+# directly and never triggers device reads.
+#
+# analyze() follows the code from the NMI, reset and IRQ vectors through
+# branches, JMP and JSR and maps out the code bytes, subroutine entry points
+# and basic-block starts. The result is cached until a write lands on code it
+# covers.
+#
+#   dis = disassembler.Disassembler(cpu)
+#   for line in dis.listing(0x0200, 0x0240):
+#       print(line)
+#   flow = dis.analyze()
+
+import collections
+
+import emulator
+
+OPERAND_LENGTH = {'IMP': 0, 'IMM': 1, 'ZP0': 1, 'ZPX': 1, 'ZPY': 1, 'REL': 1,
+                  'ABS': 2, 'ABX': 2, 'ABY': 2, 'IND': 2, 'IZX': 1, 'IZY': 1}
+
+OPERAND_FORMAT = {'IMP': '', 'IMM': '#${:02X}', 'ZP0': '${:02X}', 'ZPX': '${:02X},X',
+                  'ZPY': '${:02X},Y', 'REL': '${:04X}', 'ABS': '${:04X}', 'ABX': '${:04X},X',
+                  'ABY': '${:04X},Y', 'IND': '(${:04X})', 'IZX': '(${:02X},X)', 'IZY': '(${:02X}),Y'}
+
+BRANCHES = frozenset(('BCC', 'BCS', 'BEQ', 'BMI', 'BNE', 'BPL', 'BVC', 'BVS'))
+STOPS = frozenset(('RTS', 'RTI', 'BRK'))    # no fall-through to the next instruction
+
+# NMI, reset, IRQ/BRK
+VECTORS = (0xFFFA, 0xFFFC, 0xFFFE)
+
+Decoded = collections.namedtuple('Decoded', 'address opcode name mode operand length target')
+
+
+class Flow:
+    __slots__ = ('code', 'subroutines', 'blocks', 'indirect')
+
+    def __init__(self):
+        self.code = {}              # address of each reachable instruction -> length
+        self.subroutines = set()    # JSR targets
+        self.blocks = set()         # basic-block starts
+        self.indirect = set()       # addresses of JMP (ind), not followed
+
+    def regions(self):
+        # contiguous code ranges as (start, end) inclusive
+        regions = []
+        for address in sorted(self.code):
+            end = address + self.code[address] - 1
+            if regions and address <= regions[-1][1] + 1:
+                regions[-1][1] = max(regions[-1][1], end)
+            else:
+                regions.append([address, end])
+        return [tuple(region) for region in regions]
+
+
+class Disassembler:
+    def __init__(self, cpu):
+        self.bus = cpu.bus
+        self.lookup = cpu.lookup
+        self.cache = {}         # address -> Decoded
+        self.pages = set()      # pages carrying our write hook
+        self.flow = None
+        self.flow_bytes = None  # bitmap of the bytes the cached flow decoded
+
+    def decode(self, address):
+        address &= 0xFFFF
+        decoded = self.cache.get(address)
+        if decoded is not None:
+            return decoded
+
+        ram = self.bus.ram
+        opcode = ram[address]
+        instruction = self.lookup[opcode]
+        mode = instruction.mode
+        length = 1 + OPERAND_LENGTH[mode]
+        operand = None
+        target = None
+        if length == 2:
+            operand = ram[(address + 1) & 0xFFFF]
+        elif length == 3:
+            operand = ram[(address + 1) & 0xFFFF] | (ram[(address + 2) & 0xFFFF] << 8)
+        if mode == 'REL':
+            target = (address + 2 + (operand - 0x100 if operand & 0x80 else operand)) & 0xFFFF
+        elif mode == 'ABS' and instruction.name in ('JMP', 'JSR'):
+            target = operand
+
+        decoded = Decoded(address, opcode, instruction.name, mode, operand, length, target)
+        self.cache[address] = decoded
+        self.watch_page(address >> 8)
+        self.watch_page(((address + length - 1) & 0xFFFF) >> 8)
+        return decoded
+
+    def watch_page(self, page):
+        if page not in self.pages:
+            self.pages.add(page)
+            self.bus.add_write_hook(page, self.written)
+
+    def written(self, address, data):
+        # drop any instruction covering the written byte (it starts at most
+        # two bytes before it) and the flow map if the byte was code
+        cache = self.cache
+        for start in (address, (address - 1) & 0xFFFF, (address - 2) & 0xFFFF):
+            decoded = cache.get(start)
+            if decoded is not None and (address - start) & 0xFFFF < decoded.length:
+                del cache[start]
+        if self.flow_bytes is not None and self.flow_bytes[address]:
+            self.flow = self.flow_bytes = None
+
+    def clear(self):
+        for page in self.pages:
+            self.bus.remove_write_hook(page, self.written)
+        self.pages.clear()
+        self.cache.clear()
+        self.flow = self.flow_bytes = None
+
+    def format(self, decoded):
+        text = OPERAND_FORMAT[decoded.mode]
+        if decoded.mode == 'REL':
+            text = text.format(decoded.target)
+        elif decoded.operand is not None:
+            text = text.format(decoded.operand)
+        return (decoded.name + ' ' + text).rstrip()
+
+    def instructions(self, start, end):
+        # decoded instructions from start up to end (exclusive), linear sweep
+        address = start
+        while address < end:
+            decoded = self.decode(address)
+            yield decoded
+            address += decoded.length
+
+    def listing(self, start, end):
+        ram = self.bus.ram
+        for decoded in self.instructions(start, end):
+            code = ' '.join('{:02X}'.format(ram[(decoded.address + i) & 0xFFFF])
+                            for i in range(decoded.length))
+            yield '${:04X}  {:8}  {}'.format(decoded.address, code, self.format(decoded))
+
+    def analyze(self, entries=None):
+        # reachable code from the given entry points (default: the vectors,
+        # and then the result is cached)
+        default = entries is None
+        if default:
+            if self.flow is not None:
+                return self.flow
+            ram = self.bus.ram
+            entries = [ram[vector] | (ram[vector + 1] << 8) for vector in VECTORS]
+
+        flow = Flow()
+        flow_bytes = bytearray(emulator.Bus.SIZE)
+        flow.blocks.update(entries)
+        pending = list(entries)
+        while pending:
+            address = pending.pop()
+            while address not in flow.code:
+                decoded = self.decode(address)
+                flow.code[address] = decoded.length
+                for i in range(decoded.length):
+                    flow_bytes[(address + i) & 0xFFFF] = 1
+                name = decoded.name
+                following = (address + decoded.length) & 0xFFFF
+
+                if decoded.target is not None:
+                    flow.blocks.add(decoded.target)
+                    pending.append(decoded.target)
+                    if name == 'JSR':
+                        flow.subroutines.add(decoded.target)
+                if name == 'JMP':
+                    if decoded.mode == 'IND':
+                        flow.indirect.add(address)
+                    break
+                if name in STOPS:
+                    break
+                if name in BRANCHES or name == 'JSR':
+                    flow.blocks.add(following)
+                address = following
+
+        if default:
+            # new vectors mean a new map as well
+            for vector in VECTORS:
+                flow_bytes[vector] = flow_bytes[vector + 1] = 1
+            self.watch_page(VECTORS[0] >> 8)
+            self.flow = flow
+            self.flow_bytes = flow_bytes
+        return flow
@@ -1,301 +1,274 @@
 import enum
-from status_reg import Flag
+import hashlib
+import struct
+from status_reg import RegisterFlag, NZ, C, Z, I, D, B, U, V, N
+from alu import ADC, ADC_DECIMAL, SBC_DECIMAL, ASL, LSR, ROL, ROR, ALU_FLAGS, SHIFT_FLAGS
 
 
 class Bus:
-    def __init__(self):
-        self.ram = [0] * 0xFFFF    # temporary RAM
+    SIZE = 0x10000
+
+    def __init__(self, ram=None):
+        # full 64 KiB address space; any writable buffer of SIZE bytes will
+        # do (see shared.SharedBus)
+        self.ram = bytearray(self.SIZE) if ram is None else ram
+        self.memory = memoryview(self.ram)
+
+        # page table: one entry per 256-byte page, None means plain RAM,
+        # otherwise the handler of the device mapped there
+        self.read_pages = [None] * 256
+        self.write_pages = [None] * 256
+
+        # write_pages is derived from the device mapped on each page plus any
+        # hooks that want to observe writes to it (e.g. code caches)
+        self.write_devices = [None] * 256
+        self.write_hooks = [()] * 256
+
+        # dirty page tracking, off until track_writes() is called
+        self.dirty = None           # pages written since the last checkpoint()
+        self.unhashed = None        # pages written since the last memory_hash()
+        self.page_hashes = None
+        self.hash = 0
 
     def read(self, address):
-        if 0x0000 <= address <= 65536:
+        address &= 0xFFFF
+        handler = self.read_pages[address >> 8]
+        if handler is None:
             return self.ram[address]
+        return handler(address)
 
     def write(self, address, data):
-        if 0x0000 <= address <= 0xffff:
-            self.ram[address] = data
+        address &= 0xFFFF
+        handler = self.write_pages[address >> 8]
+        if handler is None:
+            self.ram[address] = data & 0xFF
+        else:
+            handler(address, data & 0xFF)
+
+    def map_device(self, start, end, read=None, write=None):
+        # route the pages covering start..end (inclusive) to a device;
+        # read(address) -> byte, write(address, byte). Leaving either handler
+        # as None keeps that direction on plain RAM.
+        if start & 0xFF or (end & 0xFF) != 0xFF or not 0 <= start <= end <= 0xFFFF:
+            raise ValueError('device range ${:04X}-${:04X} is not page aligned'.format(start, end))
+        for page in range(start >> 8, (end >> 8) + 1):
+            self.read_pages[page] = read
+            self.write_devices[page] = write
+            self.update_write_page(page)
+
+    def unmap_device(self, start, end):
+        self.map_device(start, end)
+
+    def add_write_hook(self, page, hook):
+        # call hook(address, data) after every write to the page; pages
+        # without hooks keep the plain RAM fast path
+        if hook not in self.write_hooks[page]:
+            self.write_hooks[page] += (hook,)
+            self.update_write_page(page)
+
+    def remove_write_hook(self, page, hook):
+        if hook in self.write_hooks[page]:
+            self.write_hooks[page] = tuple(h for h in self.write_hooks[page] if h != hook)
+            self.update_write_page(page)
+
+    def update_write_page(self, page):
+        device = self.write_devices[page]
+        hooks = self.write_hooks[page]
+        if not hooks:
+            self.write_pages[page] = device
+            return
+
+        ram = self.ram
+
+        def hooked_write(address, data):
+            if device is None:
+                ram[address] = data
+            else:
+                device(address, data)
+            for hook in hooks:
+                hook(address, data)
+
+        self.write_pages[page] = hooked_write
+
+    def check_range(self, address, length):
+        if address < 0 or length < 0 or address + length > self.SIZE:
+            raise ValueError('range ${:04X}+{} is outside the address space'.format(address, length))
+
+    # the bulk accessors below work on RAM directly and bypass mapped devices;
+    # load() still reports the bytes it changes to any write hooks
+
+    def load(self, address, data):
+        # copy a block of bytes into memory with a single slice assignment
+        self.check_range(address, len(data))
+        self.ram[address:address + len(data)] = data
+
+        if data:
+            ram = self.ram
+            end = address + len(data)
+            for page in range(address >> 8, ((end - 1) >> 8) + 1):
+                if not self.write_hooks[page]:
+                    continue
+                for addr in range(max(address, page << 8), min(end, (page + 1) << 8)):
+                    # re-read per byte, a hook may remove itself
+                    for hook in self.write_hooks[page]:
+                        hook(addr, ram[addr])
+
+    # dirty pages
+    # a clean page carries a write hook that marks it dirty on the first
+    # write and then removes itself, so the tracking costs nothing until
+    # the next checkpoint() or memory_hash() cleans the page again.
+
+    def track_writes(self):
+        # start tracking; every page counts as dirty and unhashed to begin with
+        self.dirty = bytearray(b'\x01' * 256)
+        self.unhashed = bytearray(b'\x01' * 256)
+        self.page_hashes = [0] * 256
+        self.hash = 0
+
+    def page_written(self, address, data):
+        page = address >> 8
+        self.dirty[page] = 1
+        self.unhashed[page] = 1
+        self.remove_write_hook(page, self.page_written)
+
+    def dirty_pages(self):
+        return [page for page in range(256) if self.dirty[page]]
+
+    def checkpoint(self):
+        # the pages written since the last checkpoint as (page, bytes), and
+        # start a new interval
+        pages = []
+        for page in self.dirty_pages():
+            start = page << 8
+            pages.append((page, bytes(self.ram[start:start + 256])))
+            self.dirty[page] = 0
+            self.add_write_hook(page, self.page_written)
+        return pages
+
+    def memory_hash(self):
+        # 128-bit hash of all of RAM, rehashing only pages written since the
+        # last call; each page hash covers its page number, and they are
+        # combined with xor so one page can be swapped out on its own. The
+        # first call starts write tracking if nothing has yet
+        if self.unhashed is None:
+            self.track_writes()
+        ram = self.ram
+        for page in range(256):
+            if self.unhashed[page]:
+                start = page << 8
+                digest = hashlib.blake2b(ram[start:start + 256], digest_size=16,
+                                         salt=page.to_bytes(2, 'little')).digest()
+                value = int.from_bytes(digest, 'little')
+                self.hash ^= self.page_hashes[page] ^ value
+                self.page_hashes[page] = value
+                self.unhashed[page] = 0
+                self.add_write_hook(page, self.page_written)
+        return self.hash
+
+    def dump(self, address, length):
+        self.check_range(address, length)
+        return bytes(self.ram[address:address + length])
+
+    def view(self, address=0, length=SIZE):
+        # zero-copy window onto memory; it tracks later writes
+        self.check_range(address, length)
+        return self.memory[address:address + length]
+
+
+# snapshot layout: magic, version, the registers in STATE order, then RAM
+STATE = ('a', 'x', 'y', 'sp', 'pc', 'p',
+         'fetched', 'temp', 'address_absolute', 'address_relative',
+         'opcode', 'cycles', 'clock_count', 'budget', 'halt')
+SNAPSHOT = struct.Struct('<4sH14q?')
+SNAPSHOT_MAGIC = b'6502'
+SNAPSHOT_VERSION = 1
 
 
 class CPU:
-    a = 0
-    x = 0
-    y = 0
-    sp = 0
-    pc = 0
-    status = Flag()
-
-    fetched = 0
-    temp = 0
-    address_absolute = 0
-    address_relative = 0
-    opcode = 0
-    current_byte = 0
-    cycles = 0
-    clock_count = 0
-    halt = False
-
-    def __init__(self):
-        self.bus = Bus()
+    __slots__ = ('a', 'x', 'y', 'sp', 'pc', 'p',
+                 'fetched', 'temp', 'address_absolute', 'address_relative',
+                 'opcode', 'current_byte', 'cycles', 'clock_count', 'budget',
+                 'halt', 'tracer', 'profiler', 'bus', 'read', 'write')
+
+    # decode table shared by every instance, built once per CPU class;
+    # a subclass that overrides an operator or addressing mode gets its own
+    lookup = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lookup = build_lookup(cls)
+
+    def __init__(self, bus=None):
+        self.a = 0
+        self.x = 0
+        self.y = 0
+        self.sp = 0
+        self.pc = 0
+        self.p = 0      # packed status register, see status_reg
+
+        self.fetched = 0
+        self.temp = 0
+        self.address_absolute = 0
+        self.address_relative = 0
+        self.opcode = 0
+        self.current_byte = None
+        self.cycles = 0
+        self.clock_count = 0
+        self.budget = 0     # cycles left over (negative = overshoot) between run() calls
+        self.halt = False
+        self.tracer = None
+        self.profiler = None
+
+        self.bus = Bus() if bus is None else bus
         self.read = self.bus.read
         self.write = self.bus.write
 
-        self.lookup = [
-            Instruction('BRK', self.BRK, self.IMM, 7),  # 0x00
-            Instruction('ORA', self.ORA, self.IZX, 6),  # 0x01
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x02
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x03
-            Instruction('XXX', self.XXX, self.IMP, 3),  # 0x04
-            Instruction('ORA', self.ORA, self.ZP0, 3),  # 0x05
-            Instruction('ASL', self.ASL, self.ZP0, 5),  # 0x06
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x07
-            Instruction('PHP', self.PHP, self.IMP, 3),  # 0x08
-            Instruction('ORA', self.ORA, self.IMM, 2),  # 0x09
-            Instruction('ASL', self.ASL, self.IMP, 2),  # 0x0A
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x0B
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x0C
-            Instruction('ORA', self.ORA, self.ABS, 4),  # 0x0D
-            Instruction('ASL', self.ASL, self.ABS, 6),  # 0x0E
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x0F
-            Instruction('BPL', self.BPL, self.REL, 2),  # 0x10
-            Instruction('ORA', self.ORA, self.IZY, 5),  # 0x11
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x12
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x13
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x14
-            Instruction('ORA', self.ORA, self.ZPX, 4),  # 0x15
-            Instruction('ASL', self.ASL, self.ZPX, 6),  # 0x16
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x17
-            Instruction('CLC', self.CLC, self.IMP, 2),  # 0x18
-            Instruction('ORA', self.ORA, self.ABY, 4),  # 0x19
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x1A
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x1B
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x1C
-            Instruction('ORA', self.ORA, self.ABX, 4),  # 0x1D
-            Instruction('ASL', self.ASL, self.ABX, 7),  # 0x1E
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x1F
-            Instruction('JSR', self.JSR, self.ABS, 6),  # 0x20
-            Instruction('AND', self.AND, self.IZX, 6),  # 0x21
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x22
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x23
-            Instruction('BIT', self.BIT, self.ZP0, 3),  # 0x24
-            Instruction('AND', self.AND, self.ZP0, 3),  # 0x25
-            Instruction('ROL', self.ROL, self.ZP0, 5),  # 0x26
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x27
-            Instruction('PLP', self.PLP, self.IMP, 4),  # 0x28
-            Instruction('AND', self.AND, self.IMM, 2),  # 0x29
-            Instruction('ROL', self.ROL, self.IMP, 2),  # 0x2A
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x2B
-            Instruction('BIT', self.BIT, self.ABS, 4),  # 0x2C
-            Instruction('AND', self.AND, self.ABS, 4),  # 0x2D
-            Instruction('ROL', self.ROL, self.ABS, 6),  # 0x2E
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x2F
-            Instruction('BMI', self.BMI, self.REL, 2),  # 0x30
-            Instruction('AND', self.AND, self.IZY, 5),  # 0x31
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x32
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x33
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x34
-            Instruction('AND', self.AND, self.ZPX, 4),  # 0x35
-            Instruction('ROL', self.ROL, self.ZPX, 6),  # 0x36
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x37
-            Instruction('SEC', self.SEC, self.IMP, 2),  # 0x38
-            Instruction('AND', self.AND, self.ABY, 4),  # 0x39
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x3A
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x3B
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x3C
-            Instruction('AND', self.AND, self.ABX, 4),  # 0x3D
-            Instruction('ROL', self.ROL, self.ABX, 7),  # 0x3E
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x3F
-            Instruction('RTI', self.RTI, self.IMP, 6),  # 0x40
-            Instruction('EOR', self.EOR, self.IZX, 6),  # 0x41
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x42
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x43
-            Instruction('XXX', self.XXX, self.IMP, 3),  # 0x44
-            Instruction('EOR', self.EOR, self.ZP0, 3),  # 0x45
-            Instruction('LSR', self.LSR, self.ZP0, 5),  # 0x46
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x47
-            Instruction('PHA', self.PHA, self.IMP, 3),  # 0x48
-            Instruction('EOR', self.EOR, self.IMM, 2),  # 0x49
-            Instruction('LSR', self.LSR, self.IMP, 2),  # 0x4A
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x4B
-            Instruction('JMP', self.JMP, self.ABS, 3),  # 0x4C
-            Instruction('EOR', self.EOR, self.ABS, 4),  # 0x4D
-            Instruction('LSR', self.LSR, self.ABS, 6),  # 0x4E
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x4F
-            Instruction('BVC', self.BVC, self.REL, 2),  # 0x50
-            Instruction('EOR', self.EOR, self.IZY, 5),  # 0x51
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x52
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x53
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x54
-            Instruction('EOR', self.EOR, self.ZPX, 4),  # 0x55
-            Instruction('LSR', self.LSR, self.ZPX, 6),  # 0x56
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x57
-            Instruction('CLI', self.CLI, self.IMP, 2),  # 0x58
-            Instruction('EOR', self.EOR, self.ABY, 4),  # 0x59
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x5A
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x5B
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x5C
-            Instruction('EOR', self.EOR, self.ABX, 4),  # 0x5D
-            Instruction('LSR', self.LSR, self.ABX, 7),  # 0x5E
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x5F
-            Instruction('RTS', self.RTS, self.IMP, 6),  # 0x60
-            Instruction('ADC', self.ADC, self.IZX, 6),  # 0x61
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x62
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x63
-            Instruction('XXX', self.XXX, self.IMP, 3),  # 0x64
-            Instruction('ADC', self.ADC, self.ZP0, 3),  # 0x65
-            Instruction('ROR', self.ROR, self.ZP0, 5),  # 0x66
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x67
-            Instruction('PLA', self.PLA, self.IMP, 4),  # 0x68
-            Instruction('ADC', self.ADC, self.IMM, 2),  # 0x69
-            Instruction('ROR', self.ROR, self.IMP, 2),  # 0x6A
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x6B
-            Instruction('JMP', self.JMP, self.IND, 5),  # 0x6C
-            Instruction('ADC', self.ADC, self.ABS, 4),  # 0x6D
-            Instruction('ROR', self.ROR, self.ABS, 6),  # 0x6E
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x6F
-            Instruction('BVS', self.BVS, self.REL, 2),  # 0x70
-            Instruction('ADC', self.ADC, self.IZY, 5),  # 0x71
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x72
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0x73
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x74
-            Instruction('ADC', self.ADC, self.ZPX, 4),  # 0x75
-            Instruction('ROR', self.ROR, self.ZPX, 6),  # 0x76
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x77
-            Instruction('SEI', self.SEI, self.IMP, 2),  # 0x78
-            Instruction('ADC', self.ADC, self.ABY, 4),  # 0x79
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x7A
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x7B
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x7C
-            Instruction('ADC', self.ADC, self.ABX, 4),  # 0x7D
-            Instruction('ROR', self.ROR, self.ABX, 7),  # 0x7E
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0x7F
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x80
-            Instruction('STA', self.STA, self.IZX, 6),  # 0x81
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x82
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x83
-            Instruction('STY', self.STY, self.ZP0, 3),  # 0x84
-            Instruction('STA', self.STA, self.ZP0, 3),  # 0x85
-            Instruction('STX', self.STX, self.ZP0, 3),  # 0x86
-            Instruction('XXX', self.XXX, self.IMP, 3),  # 0x87
-            Instruction('DEY', self.DEY, self.IMP, 2),  # 0x88
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x89
-            Instruction('TXA', self.TXA, self.IMP, 2),  # 0x8A
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x8B
-            Instruction('STY', self.STY, self.ABS, 4),  # 0x8C
-            Instruction('STA', self.STA, self.ABS, 4),  # 0x8D
-            Instruction('STX', self.STX, self.ABS, 4),  # 0x8E
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x8F
-            Instruction('BCC', self.BCC, self.REL, 2),  # 0x90
-            Instruction('STA', self.STA, self.IZY, 6),  # 0x91
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0x92
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0x93
-            Instruction('STY', self.STY, self.ZPX, 4),  # 0x94
-            Instruction('STA', self.STA, self.ZPX, 4),  # 0x95
-            Instruction('STX', self.STX, self.ZPY, 4),  # 0x96
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0x97
-            Instruction('TYA', self.TYA, self.IMP, 2),  # 0x98
-            Instruction('STA', self.STA, self.ABY, 5),  # 0x99
-            Instruction('TXS', self.TXS, self.IMP, 2),  # 0x9A
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x9B
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x9C
-            Instruction('STA', self.STA, self.ABX, 5),  # 0x9D
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x9E
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0x9F
-            Instruction('LDY', self.LDY, self.IMM, 2),  # 0xA0
-            Instruction('LDA', self.LDA, self.IZX, 6),  # 0xA1
-            Instruction('LDX', self.LDX, self.IMM, 2),  # 0xA2
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0xA3
-            Instruction('LDY', self.LDY, self.ZP0, 3),  # 0xA4
-            Instruction('LDA', self.LDA, self.ZP0, 3),  # 0xA5
-            Instruction('LDX', self.LDX, self.ZP0, 3),  # 0xA6
-            Instruction('XXX', self.XXX, self.IMP, 3),  # 0xA7
-            Instruction('TAY', self.TAY, self.IMP, 2),  # 0xA8
-            Instruction('LDA', self.LDA, self.IMM, 2),  # 0xA9
-            Instruction('TAX', self.TAX, self.IMP, 2),  # 0xAA
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xAB
-            Instruction('LDY', self.LDY, self.ABS, 4),  # 0xAC
-            Instruction('LDA', self.LDA, self.ABS, 4),  # 0xAD
-            Instruction('LDX', self.LDX, self.ABS, 4),  # 0xAE
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xAF
-            Instruction('BCS', self.BCS, self.REL, 2),  # 0xB0
-            Instruction('LDA', self.LDA, self.IZY, 5),  # 0xB1
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xB2
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0xB3
-            Instruction('LDY', self.LDY, self.ZPX, 4),  # 0xB4
-            Instruction('LDA', self.LDA, self.ZPX, 4),  # 0xB5
-            Instruction('LDX', self.LDX, self.ZPY, 4),  # 0xB6
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xB7
-            Instruction('CLV', self.CLV, self.IMP, 2),  # 0xB8
-            Instruction('LDA', self.LDA, self.ABY, 4),  # 0xB9
-            Instruction('TSX', self.TSX, self.IMP, 2),  # 0xBA
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xBB
-            Instruction('LDY', self.LDY, self.ABX, 4),  # 0xBC
-            Instruction('LDA', self.LDA, self.ABX, 4),  # 0xBD
-            Instruction('LDX', self.LDX, self.ABY, 4),  # 0xBE
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xBF
-            Instruction('CPY', self.CPY, self.IMM, 2),  # 0xC0
-            Instruction('CMP', self.CMP, self.IZX, 6),  # 0xC1
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xC2
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0xC3
-            Instruction('CPY', self.CPY, self.ZP0, 3),  # 0xC4
-            Instruction('CMP', self.CMP, self.ZP0, 3),  # 0xC5
-            Instruction('DEC', self.DEC, self.ZP0, 5),  # 0xC6
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0xC7
-            Instruction('INY', self.INY, self.IMP, 2),  # 0xC8
-            Instruction('CMP', self.CMP, self.IMM, 2),  # 0xC9
-            Instruction('DEX', self.DEX, self.IMP, 2),  # 0xCA
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xCB
-            Instruction('CPY', self.CPY, self.ABS, 4),  # 0xCC
-            Instruction('CMP', self.CMP, self.ABS, 4),  # 0xCD
-            Instruction('DEC', self.DEC, self.ABS, 6),  # 0xCE
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0xCF
-            Instruction('BNE', self.BNE, self.REL, 2),  # 0xD0
-            Instruction('CMP', self.CMP, self.IZY, 5),  # 0xD1
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xD2
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0xD3
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xD4
-            Instruction('CMP', self.CMP, self.ZPX, 4),  # 0xD5
-            Instruction('DEC', self.DEC, self.ZPX, 6),  # 0xD6
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0xD7
-            Instruction('CLD', self.CLD, self.IMP, 2),  # 0xD8
-            Instruction('CMP', self.CMP, self.ABY, 4),  # 0xD9
-            Instruction('NOP', self.NOP, self.IMP, 2),  # 0xDA
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0xDB
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xDC
-            Instruction('CMP', self.CMP, self.ABX, 4),  # 0xDD
-            Instruction('DEC', self.DEC, self.ABX, 7),  # 0xDE
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0xDF
-            Instruction('CPX', self.CPX, self.IMM, 2),  # 0xE0
-            Instruction('SBC', self.SBC, self.IZX, 6),  # 0xE1
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xE2
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0xE3
-            Instruction('CPX', self.CPX, self.ZP0, 3),  # 0xE4
-            Instruction('SBC', self.SBC, self.ZP0, 3),  # 0xE5
-            Instruction('INC', self.INC, self.ZP0, 5),  # 0xE6
-            Instruction('XXX', self.XXX, self.IMP, 5),  # 0xE7
-            Instruction('INX', self.INX, self.IMP, 2),  # 0xE8
-            Instruction('SBC', self.SBC, self.IMM, 2),  # 0xE9
-            Instruction('NOP', self.NOP, self.IMP, 2),  # 0xEA
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xEB
-            Instruction('CPX', self.CPX, self.ABS, 4),  # 0xEC
-            Instruction('SBC', self.SBC, self.ABS, 4),  # 0xED
-            Instruction('INC', self.INC, self.ABS, 6),  # 0xEE
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0xEF
-            Instruction('BEQ', self.BEQ, self.REL, 2),  # 0xF0
-            Instruction('SBC', self.SBC, self.IZY, 5),  # 0xF1
-            Instruction('XXX', self.XXX, self.IMP, 2),  # 0xF2
-            Instruction('XXX', self.XXX, self.IMP, 8),  # 0xF3
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xF4
-            Instruction('SBC', self.SBC, self.ZPX, 4),  # 0xF5
-            Instruction('INC', self.INC, self.ZPX, 6),  # 0xF6
-            Instruction('XXX', self.XXX, self.IMP, 6),  # 0xF7
-            Instruction('SED', self.SED, self.IMP, 2),  # 0xF8
-            Instruction('SBC', self.SBC, self.ABY, 4),  # 0xF9
-            Instruction('NOP', self.NOP, self.IMP, 2),  # 0xFA
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0xFB
-            Instruction('XXX', self.XXX, self.IMP, 4),  # 0xFC
-            Instruction('SBC', self.SBC, self.ABX, 4),  # 0xFD
-            Instruction('INC', self.INC, self.ABX, 7),  # 0xFE
-            Instruction('XXX', self.XXX, self.IMP, 7),  # 0xFF
-        ]
+    @property
+    def status(self):
+        return RegisterFlag(self)
+
+    def save_registers(self):
+        return SNAPSHOT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                             *[getattr(self, name) for name in STATE])
+
+    def load_registers(self, header):
+        magic, version, *values = SNAPSHOT.unpack_from(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError('not a version {} CPU snapshot'.format(SNAPSHOT_VERSION))
+        for name, value in zip(STATE, values):
+            setattr(self, name, value)
+        self.current_byte = self.lookup[self.opcode]
+
+    def snapshot(self):
+        # registers, pending cycles and all of RAM as one bytes object;
+        # devices mapped on the bus keep their own state
+        return self.save_registers() + self.bus.ram
+
+    def restore(self, state):
+        if len(state) != SNAPSHOT.size + Bus.SIZE:
+            raise ValueError('snapshot is {} bytes, expected {}'.format(
+                len(state), SNAPSHOT.size + Bus.SIZE))
+        self.load_registers(state)
+        # through load() so code caches watching the bus see the new bytes
+        self.bus.load(0, memoryview(state)[SNAPSHOT.size:])
+
+    def fork(self):
+        # independent copy of this machine as it stands now, RAM included;
+        # no reset() and no re-run of the boot code. Devices, tracer and
+        # profiler are not carried over.
+        clone = type(self)()
+        for name in STATE:
+            setattr(clone, name, getattr(self, name))
+        clone.current_byte = self.current_byte
+        clone.bus.ram[:] = self.bus.ram
+        return clone
+
+    def state_hash(self):
+        # hash of the architectural registers and RAM, leaving out scratch
+        # fields and the clock, so machines in the same state hash the same;
+        # costs O(pages written since the last call) once the first call has
+        # hashed every page
+        return hash((self.bus.memory_hash(), self.a, self.x, self.y, self.sp, self.pc & 0xFFFF, self.p))
 
     def reset(self):
         # Look up starting address at 0xFFFC
@@ -309,7 +282,7 @@ class CPU:
         self.x = 0
         self.y = 0
         self.sp = 0xFD
-        self.status.U = True
+        self.p |= U
 
         self.address_absolute = 0
         self.address_relative = 0
@@ -317,14 +290,46 @@ class CPU:
         self.cycles = 8
 
 
+    def interrupt(self, vector):
+        # push pc and status (B clear), mask further IRQs and jump through
+        # the vector; the cycles are owed like reset()'s and charged to the
+        # next instruction
+        self.write(0x0100 + self.sp, (self.pc >> 8) & 0x00FF)
+        self.sp = (self.sp - 1) & 0x00FF
+        self.write(0x0100 + self.sp, self.pc & 0x00FF)
+        self.sp = (self.sp - 1) & 0x00FF
+        self.write(0x0100 + self.sp, (self.p & ~B) | U)
+        self.sp = (self.sp - 1) & 0x00FF
+        self.p |= I
+        self.pc = self.read(vector) | (self.read(vector + 1) << 8)
+        if self.profiler is not None:
+            self.profiler.interrupted()
+
     def irq(self):
-        pass
+        # returns False, doing nothing, while interrupts are masked
+        if self.p & I:
+            return False
+        self.interrupt(0xFFFE)
+        self.cycles += 7
+        return True
 
     def nmi(self):
-        pass
+        self.interrupt(0xFFFA)
+        self.cycles += 8
+        return True
+
+    def set_tracer(self, tracer):
+        # tracing is picked up by the next run() call; pass None to turn it off
+        self.tracer = tracer
+
+    def set_profiler(self, profiler):
+        # like set_tracer(): picked up by the next run() call, None turns it off
+        self.profiler = profiler
 
     def clock(self):
         if self.cycles == 0:
+            if self.tracer is not None:
+                self.trace_record()
             self.opcode = self.read(self.pc)
             self.current_byte = self.lookup[self.opcode]
             self.pc += 1
@@ -332,19 +337,104 @@ class CPU:
 
             # get needed bytes per addressing mode
             # execute operator
-            self.current_byte.addr_mode()
-            self.current_byte.operator()
+            self.current_byte.addr_mode(self)
+            self.current_byte.operator(self)
         self.cycles -= 1
         self.clock_count += 1
-        print('clock: {}  cycle: {}  pc: {}  fetched: {}  opcode: {}'.format(
-            self.clock_count, self.cycles, self.pc, self.fetched,
-            self.lookup[self.opcode].name))
+
+    def trace_record(self):
+        # clock count is taken as of the start of the next instruction
+        self.tracer.record(self.pc, self.read(self.pc), self.a, self.x, self.y,
+                           self.sp, self.p, self.clock_count + self.cycles)
+
+    def step(self):
+        # execute one whole instruction and return the cycles it cost,
+        # including any cycles still owed by reset() or a part-done clock()
+        owed = self.cycles
+
+        self.opcode = self.read(self.pc)
+        self.current_byte = self.lookup[self.opcode]
+        self.pc += 1
+        self.cycles = self.current_byte.cycles
+
+        self.current_byte.addr_mode(self)
+        self.current_byte.operator(self)
+
+        spent = owed + self.cycles
+        self.cycles = 0
+        self.clock_count += spent
+        return spent
+
+    def traced_step(self):
+        self.trace_record()
+        return self.step()
+
+    def profiled_step(self):
+        # step() with the cycles the addressing mode and the operator add
+        # (page crossings, taken branches) measured separately
+        if self.tracer is not None:
+            self.trace_record()
+        owed = self.cycles
+        pc = self.pc
+
+        self.opcode = self.read(pc)
+        instruction = self.current_byte = self.lookup[self.opcode]
+        self.pc += 1
+        self.cycles = instruction.cycles
+
+        instruction.addr_mode(self)
+        mode_cycles = self.cycles - instruction.cycles
+        instruction.operator(self)
+        operator_cycles = self.cycles - instruction.cycles - mode_cycles
+
+        spent = owed + self.cycles
+        self.cycles = 0
+        self.clock_count += spent
+        self.profiler.record(pc & 0xFFFF, instruction, self.opcode, spent, mode_cycles, operator_cycles)
+        return spent
+
+    def stepper(self):
+        # the step method for the current tracing and profiling settings
+        if self.profiler is not None:
+            return self.profiled_step
+        if self.tracer is not None:
+            return self.traced_step
+        return self.step
+
+    def run(self, cycles=None, instructions=None):
+        # run whole instructions until the cycle budget or instruction count
+        # is used up; the cycles an instruction overshoots the budget by are
+        # carried into the next call so repeated runs stay cycle exact
+        if cycles is None and instructions is None:
+            raise ValueError('run() needs cycles or instructions')
+        # pick the loop body once so an untraced, unprofiled run makes no
+        # tracing or profiling calls
+        step = self.stepper()
+        executed = 0
+
+        if cycles is None:
+            while executed < instructions and not self.halt:
+                step()
+                executed += 1
+            return executed
+
+        budget = self.budget + cycles
+        if instructions is None:
+            while budget > 0 and not self.halt:
+                budget -= step()
+                executed += 1
+        else:
+            while budget > 0 and executed < instructions and not self.halt:
+                budget -= step()
+                executed += 1
+        self.budget = budget
+        return executed
 
     def complete(self):
         pass
 
     def fetch(self):
-        if not self.lookup[self.opcode].addr_mode == self.IMP():
+        if self.current_byte.mode != 'IMP':
             self.fetched = self.bus.read(self.address_absolute)
             # return self.fetched
 
@@ -353,8 +443,8 @@ class CPU:
         self.cycles += 0
 
     def IMM(self):
-        self.address_absolute = self.pc + 1
-        print(f'addr_abs set to {self.address_absolute}')
+        self.address_absolute = self.pc
+        self.pc += 1
         self.cycles += 0
 
     def ZP0(self):
@@ -388,7 +478,7 @@ class CPU:
         hi_byte = self.read(self.pc)
         self.pc += 1
 
-        self.address_relative = (hi_byte << 8) | lo_byte
+        self.address_absolute = (hi_byte << 8) | lo_byte
         self.cycles += 0
 
     def ABX(self):
@@ -397,10 +487,10 @@ class CPU:
         hi_byte = self.read(self.pc)
         self.pc += 1
 
-        self.address_relative = (hi_byte << 8) | lo_byte
-        self.address_relative += self.x
+        self.address_absolute = (hi_byte << 8) | lo_byte
+        self.address_absolute += self.x
 
-        if (self.address_relative & 0xFF00) != (hi_byte << 8):
+        if (self.address_absolute & 0xFF00) != (hi_byte << 8):
             self.cycles += 1
         else:
             self.cycles += 0
@@ -411,10 +501,10 @@ class CPU:
         hi_byte = self.read(self.pc)
         self.pc += 1
 
-        self.address_relative = (hi_byte << 8) | lo_byte
-        self.address_relative += self.y
+        self.address_absolute = (hi_byte << 8) | lo_byte
+        self.address_absolute += self.y
 
-        if (self.address_relative & 0xFF00) != (hi_byte << 8):
+        if (self.address_absolute & 0xFF00) != (hi_byte << 8):
             self.cycles += 1
         else:
             self.cycles += 0
@@ -427,9 +517,9 @@ class CPU:
 
         pointer = (hi_ptr << 8) | lo_ptr
         if lo_ptr == 0x00FF:
-            self.address_relative = (self.read(pointer & 0xFF00) << 8) | self.read(pointer + 0)
+            self.address_absolute = (self.read(pointer & 0xFF00) << 8) | self.read(pointer + 0)
         else:
-            self.address_relative = (self.read(pointer + 1) << 8) | self.read(pointer + 0)
+            self.address_absolute = (self.read(pointer + 1) << 8) | self.read(pointer + 0)
         self.cycles += 0
 
     def IZX(self):
@@ -457,37 +547,39 @@ class CPU:
             self.cycles += 0
 
     def ADC(self):      # instructions
+        # result and flags come from the alu tables, see alu.py
         self.fetch()
-        temp = self.a + self.fetched + int(self.status.C)
-        self.status.C = bool(temp > 255)
-        self.status.Z = bool((temp & 0x00FF) == 0)
-        self.status.V = bool(-(self.a ^ self.fetched) & (self.a ^ temp) & 0x0080)
+        index = ((self.p & C) << 16) | (self.a << 8) | self.fetched
+        if self.p & D:
+            temp = ADC_DECIMAL[index]
+        else:
+            temp = ADC[index]
+        self.a = temp & 0x00FF
+        self.p = (self.p & ~ALU_FLAGS) | (temp >> 8)
         self.cycles += 0
 
     def AND(self):
         self.fetch()
         self.a = self.a & self.fetched
-        self.status.Z = bool(self.a == 0x00)
-        self.status.N = bool(self.a & 0x80)
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
 
         # self.cycles += 0    # no additional clock cycles needed
         self.cycles += 0
 
     def ASL(self):
         self.fetch()
-        temp = self.fetched << 1
-        self.status.C = bool((temp & 0xFF00) > 0)
-        self.status.Z = bool((temp & 0x00FF) == 0)
-        if self.current_byte.addr_mode == self.IMP:
+        temp = ASL[self.fetched]
+        self.p = (self.p & ~SHIFT_FLAGS) | (temp >> 8)
+        if self.current_byte.mode == 'IMP':
             self.a = temp & 0x00FF
         else:
             self.write(self.address_absolute, temp & 0x00FF)
         self.cycles += 0
 
     def BCC(self):
-        if self.status.C == 0:
+        if not self.p & C:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -496,9 +588,9 @@ class CPU:
         self.cycles += 0
 
     def BCS(self):
-        if self.status.C == 1:
+        if self.p & C:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -507,9 +599,9 @@ class CPU:
         self.cycles += 0
 
     def BEQ(self):
-        if self.status.Z == 1:
+        if self.p & Z:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -520,15 +612,16 @@ class CPU:
     def BIT(self):
         self.fetch()
         temp = self.a & self.fetched
-        self.status.Z = bool((temp & 0x00FF) == 0)
-        self.status.N = bool(self.fetched & (1 << 7))
-        self.status.V = bool(self.fetched & (1 << 6))
+        p = (self.p & ~(Z | V | N)) | (self.fetched & (N | V))
+        if not temp & 0x00FF:
+            p |= Z
+        self.p = p
         self.cycles += 0
 
     def BMI(self):
-        if self.status.N == 1:
+        if self.p & N:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -537,9 +630,9 @@ class CPU:
         self.cycles += 0
 
     def BNE(self):
-        if self.status.Z == 0:
+        if not self.p & Z:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -548,9 +641,9 @@ class CPU:
         self.cycles += 0
 
     def BPL(self):
-        if self.status.N == 0:
+        if not self.p & N:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -559,17 +652,15 @@ class CPU:
         self.cycles += 0
 
     def BRK(self):
-        self.pc += 1
-        self.status.I = True
+        # the signature byte was already consumed as an immediate operand
+        self.p |= I
         self.write(0x0100 + self.sp, (self.pc >> 8) & 0x00FF)
-        self.sp -= 1
-        self.write(0x0100 + self.sp, self.sp & 0x00FF)
-        self.sp -= 1
-
-        self.status.B = True
-        self.write(0x0100 + self.sp, self.status.get_byte())
-        self.sp -= 1
-        self.status.B = False
+        self.sp = (self.sp - 1) & 0x00FF
+        self.write(0x0100 + self.sp, self.pc & 0x00FF)
+        self.sp = (self.sp - 1) & 0x00FF
+
+        self.write(0x0100 + self.sp, self.p | B)
+        self.sp = (self.sp - 1) & 0x00FF
         self.pc = self.read(0xFFFE) | (self.read(0xFFFF) << 8)
 
         self.halt = True
@@ -577,9 +668,9 @@ class CPU:
         self.cycles += 0
 
     def BVC(self):
-        if self.status.V == 0:
+        if not self.p & V:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -588,9 +679,9 @@ class CPU:
         self.cycles += 0
 
     def BVS(self):
-        if self.status.V == 1:
+        if self.p & V:
             self.cycles += 1
-            self.address_absolute = self.pc + self.address_relative
+            self.address_absolute = (self.pc + self.address_relative) & 0xFFFF
 
             if (self.address_absolute & 0xFF00) != (self.pc & 0xFF00):
                 self.cycles += 1
@@ -599,90 +690,86 @@ class CPU:
         self.cycles += 0
 
     def CLC(self):
-        self.status.C = False
+        self.p &= ~C
         self.cycles += 0
 
     def CLD(self):
-        self.status.D = False
+        self.p &= ~D
         self.cycles += 0
 
     def CLI(self):
-        self.status.I = False
+        self.p &= ~I
         self.cycles += 0
 
     def CLV(self):
-        self.status.V = False
+        self.p &= ~V
         self.cycles += 0
 
     def CMP(self):
         self.fetch()
         temp = self.a - self.fetched
-        self.status.C = bool(self.a >= self.fetched)
-        self.status.Z = bool((temp & 0x00FF) == 0x0000)
-        self.status.N = bool(temp & 0x0080)
+        p = (self.p & ~(C | Z | N)) | NZ[temp & 0x00FF]
+        if self.a >= self.fetched:
+            p |= C
+        self.p = p
         self.cycles += 1
 
     def CPX(self):
         self.fetch()
         temp = self.x - self.fetched
-        self.status.C = bool(self.x >= self.fetched)
-        self.status.Z = bool((temp & 0x00FF) == 0x0000)
-        self.status.N = bool(temp & 0x0080)
+        p = (self.p & ~(C | Z | N)) | NZ[temp & 0x00FF]
+        if self.x >= self.fetched:
+            p |= C
+        self.p = p
         self.cycles += 0
 
     def CPY(self):
         self.fetch()
         temp = self.y - self.fetched
-        self.status.C = bool(self.y >= self.fetched)
-        self.status.Z = bool((temp & 0x00FF) == 0x0000)
-        self.status.N = bool(temp & 0x0080)
+        p = (self.p & ~(C | Z | N)) | NZ[temp & 0x00FF]
+        if self.y >= self.fetched:
+            p |= C
+        self.p = p
         self.cycles += 0
 
     def DEC(self):
         self.fetch()
         temp = self.fetched - 1
         self.write(self.address_absolute, temp & 0x00FF)
-        self.status.Z = bool((temp & 0x00FF) == 0x0000)
-        self.status.N = bool(temp & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[temp & 0x00FF]
         self.cycles += 0
 
     def DEX(self):
-        self.x -= 1
-        self.status.Z = bool(self.x == 0x00)
-        self.status.N = bool(self.x & 0x0080)
+        self.x = (self.x - 1) & 0x00FF
+        self.p = (self.p & ~(Z | N)) | NZ[self.x]
         self.cycles += 0
 
     def DEY(self):
-        self.y -= 1
-        self.status.Z = bool(self.y == 0x00)
-        self.status.N = bool(self.y & 0x0080)
+        self.y = (self.y - 1) & 0x00FF
+        self.p = (self.p & ~(Z | N)) | NZ[self.y]
         self.cycles += 0
 
     def EOR(self):
         self.fetch()
         self.a = self.a ^ self.fetched
-        self.status.Z = bool(self.a == 0x00)
-        self.status.N = bool(self.a & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 0
 
     def INC(self):
         self.fetch()
         temp = self.fetched + 1
         self.write(self.address_absolute, temp & 0x00FF)
-        self.status.Z = bool((temp & 0x00FF) == 0x0000)
-        self.status.N = bool(temp & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[temp & 0x00FF]
         self.cycles += 0
 
     def INX(self):
-        self.x += 1
-        self.status.Z = bool(self.x == 0x00)
-        self.status.N = bool(self.x & 0x0080)
+        self.x = (self.x + 1) & 0x00FF
+        self.p = (self.p & ~(Z | N)) | NZ[self.x]
         self.cycles += 0
 
     def INY(self):
-        self.y += 1
-        self.status.Z = bool(self.y == 0x00)
-        self.status.N = bool(self.y & 0x0080)
+        self.y = (self.y + 1) & 0x00FF
+        self.p = (self.p & ~(Z | N)) | NZ[self.y]
         self.cycles += 0
 
     def JMP(self):
@@ -692,10 +779,10 @@ class CPU:
     def JSR(self):
         self.pc -= 1
 
-        self.write(0x0100 + self.sp, (self.pc << 8) & 0x00FF)
-        self.sp -= 1
+        self.write(0x0100 + self.sp, (self.pc >> 8) & 0x00FF)
+        self.sp = (self.sp - 1) & 0x00FF
         self.write(0x0100 + self.sp, self.pc & 0x00FF)
-        self.sp -= 1
+        self.sp = (self.sp - 1) & 0x00FF
 
         self.pc = self.address_absolute
         self.cycles += 0
@@ -703,94 +790,160 @@ class CPU:
     def LDA(self):
         self.fetch()
         self.a = self.fetched
-        self.status.Z = bool(self.a == 0x00)
-        self.status.N = bool(self.a & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 1
 
     def LDX(self):
         self.fetch()
         self.x = self.fetched
-        self.status.Z = bool(self.x == 0x00)
-        self.status.N = bool(self.x & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[self.x]
         self.cycles += 0
 
     def LDY(self):
         self.fetch()
         self.y = self.fetched
-        self.status.Z = bool(self.y == 0x00)
-        self.status.N = bool(self.y & 0x0080)
+        self.p = (self.p & ~(Z | N)) | NZ[self.y]
         self.cycles += 0
 
     def LSR(self):
+        self.fetch()
+        temp = LSR[self.fetched]
+        self.p = (self.p & ~SHIFT_FLAGS) | (temp >> 8)
+        if self.current_byte.mode == 'IMP':
+            self.a = temp & 0x00FF
+        else:
+            self.write(self.address_absolute, temp & 0x00FF)
         self.cycles += 0
 
     def NOP(self):
         self.cycles += 0
 
     def ORA(self):
+        self.fetch()
+        self.a = self.a | self.fetched
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 0
 
     def PHA(self):
+        self.write(0x0100 + self.sp, self.a)
+        self.sp = (self.sp - 1) & 0x00FF
         self.cycles += 0
 
     def PHP(self):
+        self.write(0x0100 + self.sp, self.p | B | U)
+        self.sp = (self.sp - 1) & 0x00FF
         self.cycles += 0
 
     def PLA(self):
+        self.sp = (self.sp + 1) & 0x00FF
+        self.a = self.read(0x0100 + self.sp)
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 0
 
     def PLP(self):
+        self.sp = (self.sp + 1) & 0x00FF
+        self.p = (self.read(0x0100 + self.sp) & ~B) | U
         self.cycles += 0
 
     def ROL(self):
+        self.fetch()
+        temp = ROL[((self.p & C) << 8) | self.fetched]
+        self.p = (self.p & ~SHIFT_FLAGS) | (temp >> 8)
+        if self.current_byte.mode == 'IMP':
+            self.a = temp & 0x00FF
+        else:
+            self.write(self.address_absolute, temp & 0x00FF)
         self.cycles += 0
 
     def ROR(self):
+        self.fetch()
+        temp = ROR[((self.p & C) << 8) | self.fetched]
+        self.p = (self.p & ~SHIFT_FLAGS) | (temp >> 8)
+        if self.current_byte.mode == 'IMP':
+            self.a = temp & 0x00FF
+        else:
+            self.write(self.address_absolute, temp & 0x00FF)
         self.cycles += 0
 
     def RTI(self):
+        self.sp = (self.sp + 1) & 0x00FF
+        self.p = (self.read(0x0100 + self.sp) & ~B) | U
+        self.sp = (self.sp + 1) & 0x00FF
+        self.pc = self.read(0x0100 + self.sp)
+        self.sp = (self.sp + 1) & 0x00FF
+        self.pc |= self.read(0x0100 + self.sp) << 8
         self.cycles += 0
 
     def RTS(self):
+        self.sp = (self.sp + 1) & 0x00FF
+        self.pc = self.read(0x0100 + self.sp)
+        self.sp = (self.sp + 1) & 0x00FF
+        self.pc |= self.read(0x0100 + self.sp) << 8
+        self.pc += 1
         self.cycles += 0
 
     def SBC(self):
+        # binary subtraction is addition of the inverted operand
+        self.fetch()
+        if self.p & D:
+            temp = SBC_DECIMAL[((self.p & C) << 16) | (self.a << 8) | self.fetched]
+        else:
+            temp = ADC[((self.p & C) << 16) | (self.a << 8) | (self.fetched ^ 0x00FF)]
+        self.a = temp & 0x00FF
+        self.p = (self.p & ~ALU_FLAGS) | (temp >> 8)
         self.cycles += 0
 
     def SEC(self):
+        self.p |= C
         self.cycles += 0
 
     def SED(self):
+        self.p |= D
         self.cycles += 0
 
     def SEI(self):
+        self.p |= I
         self.cycles += 0
 
     def STA(self):
+        self.write(self.address_absolute, self.a)
         self.cycles += 0
 
     def STX(self):
+        self.write(self.address_absolute, self.x)
         self.cycles += 0
 
     def STY(self):
+        self.write(self.address_absolute, self.y)
         self.cycles += 0
 
     def TAX(self):
+        self.x = self.a
+        self.p = (self.p & ~(Z | N)) | NZ[self.x]
         self.cycles += 0
 
     def TAY(self):
+        self.y = self.a
+        self.p = (self.p & ~(Z | N)) | NZ[self.y]
         self.cycles += 0
 
     def TSX(self):
+        self.x = self.sp
+        self.p = (self.p & ~(Z | N)) | NZ[self.x]
         self.cycles += 0
 
     def TXA(self):
+        self.a = self.x
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 0
 
     def TXS(self):
+        self.sp = self.x
         self.cycles += 0
 
     def TYA(self):
+        self.a = self.y
+        self.p = (self.p & ~(Z | N)) | NZ[self.a]
         self.cycles += 0
 
     def XXX(self):
@@ -798,9 +951,281 @@ class CPU:
 
 
 class Instruction:
+    __slots__ = ('name', 'operator', 'addr_mode', 'mode', 'cycles')
+
     def __init__(self, name, operator, addr_mode, cycles):
         self.name = name
-        self.operator = operator
+        self.operator = operator        # unbound, called as operator(cpu)
         self.addr_mode = addr_mode
+        self.mode = addr_mode.__name__
         self.cycles = cycles
 
+
+# name, addressing mode, base cycles for every opcode
+OPCODES = [
+    ('BRK', 'IMM', 7),  # 0x00
+    ('ORA', 'IZX', 6),  # 0x01
+    ('XXX', 'IMP', 2),  # 0x02
+    ('XXX', 'IMP', 8),  # 0x03
+    ('XXX', 'IMP', 3),  # 0x04
+    ('ORA', 'ZP0', 3),  # 0x05
+    ('ASL', 'ZP0', 5),  # 0x06
+    ('XXX', 'IMP', 5),  # 0x07
+    ('PHP', 'IMP', 3),  # 0x08
+    ('ORA', 'IMM', 2),  # 0x09
+    ('ASL', 'IMP', 2),  # 0x0A
+    ('XXX', 'IMP', 2),  # 0x0B
+    ('XXX', 'IMP', 4),  # 0x0C
+    ('ORA', 'ABS', 4),  # 0x0D
+    ('ASL', 'ABS', 6),  # 0x0E
+    ('XXX', 'IMP', 6),  # 0x0F
+    ('BPL', 'REL', 2),  # 0x10
+    ('ORA', 'IZY', 5),  # 0x11
+    ('XXX', 'IMP', 2),  # 0x12
+    ('XXX', 'IMP', 8),  # 0x13
+    ('XXX', 'IMP', 4),  # 0x14
+    ('ORA', 'ZPX', 4),  # 0x15
+    ('ASL', 'ZPX', 6),  # 0x16
+    ('XXX', 'IMP', 6),  # 0x17
+    ('CLC', 'IMP', 2),  # 0x18
+    ('ORA', 'ABY', 4),  # 0x19
+    ('XXX', 'IMP', 2),  # 0x1A
+    ('XXX', 'IMP', 7),  # 0x1B
+    ('XXX', 'IMP', 4),  # 0x1C
+    ('ORA', 'ABX', 4),  # 0x1D
+    ('ASL', 'ABX', 7),  # 0x1E
+    ('XXX', 'IMP', 7),  # 0x1F
+    ('JSR', 'ABS', 6),  # 0x20
+    ('AND', 'IZX', 6),  # 0x21
+    ('XXX', 'IMP', 2),  # 0x22
+    ('XXX', 'IMP', 8),  # 0x23
+    ('BIT', 'ZP0', 3),  # 0x24
+    ('AND', 'ZP0', 3),  # 0x25
+    ('ROL', 'ZP0', 5),  # 0x26
+    ('XXX', 'IMP', 5),  # 0x27
+    ('PLP', 'IMP', 4),  # 0x28
+    ('AND', 'IMM', 2),  # 0x29
+    ('ROL', 'IMP', 2),  # 0x2A
+    ('XXX', 'IMP', 2),  # 0x2B
+    ('BIT', 'ABS', 4),  # 0x2C
+    ('AND', 'ABS', 4),  # 0x2D
+    ('ROL', 'ABS', 6),  # 0x2E
+    ('XXX', 'IMP', 6),  # 0x2F
+    ('BMI', 'REL', 2),  # 0x30
+    ('AND', 'IZY', 5),  # 0x31
+    ('XXX', 'IMP', 2),  # 0x32
+    ('XXX', 'IMP', 8),  # 0x33
+    ('XXX', 'IMP', 4),  # 0x34
+    ('AND', 'ZPX', 4),  # 0x35
+    ('ROL', 'ZPX', 6),  # 0x36
+    ('XXX', 'IMP', 6),  # 0x37
+    ('SEC', 'IMP', 2),  # 0x38
+    ('AND', 'ABY', 4),  # 0x39
+    ('XXX', 'IMP', 2),  # 0x3A
+    ('XXX', 'IMP', 7),  # 0x3B
+    ('XXX', 'IMP', 4),  # 0x3C
+    ('AND', 'ABX', 4),  # 0x3D
+    ('ROL', 'ABX', 7),  # 0x3E
+    ('XXX', 'IMP', 7),  # 0x3F
+    ('RTI', 'IMP', 6),  # 0x40
+    ('EOR', 'IZX', 6),  # 0x41
+    ('XXX', 'IMP', 2),  # 0x42
+    ('XXX', 'IMP', 8),  # 0x43
+    ('XXX', 'IMP', 3),  # 0x44
+    ('EOR', 'ZP0', 3),  # 0x45
+    ('LSR', 'ZP0', 5),  # 0x46
+    ('XXX', 'IMP', 5),  # 0x47
+    ('PHA', 'IMP', 3),  # 0x48
+    ('EOR', 'IMM', 2),  # 0x49
+    ('LSR', 'IMP', 2),  # 0x4A
+    ('XXX', 'IMP', 2),  # 0x4B
+    ('JMP', 'ABS', 3),  # 0x4C
+    ('EOR', 'ABS', 4),  # 0x4D
+    ('LSR', 'ABS', 6),  # 0x4E
+    ('XXX', 'IMP', 6),  # 0x4F
+    ('BVC', 'REL', 2),  # 0x50
+    ('EOR', 'IZY', 5),  # 0x51
+    ('XXX', 'IMP', 2),  # 0x52
+    ('XXX', 'IMP', 8),  # 0x53
+    ('XXX', 'IMP', 4),  # 0x54
+    ('EOR', 'ZPX', 4),  # 0x55
+    ('LSR', 'ZPX', 6),  # 0x56
+    ('XXX', 'IMP', 6),  # 0x57
+    ('CLI', 'IMP', 2),  # 0x58
+    ('EOR', 'ABY', 4),  # 0x59
+    ('XXX', 'IMP', 2),  # 0x5A
+    ('XXX', 'IMP', 7),  # 0x5B
+    ('XXX', 'IMP', 4),  # 0x5C
+    ('EOR', 'ABX', 4),  # 0x5D
+    ('LSR', 'ABX', 7),  # 0x5E
+    ('XXX', 'IMP', 7),  # 0x5F
+    ('RTS', 'IMP', 6),  # 0x60
+    ('ADC', 'IZX', 6),  # 0x61
+    ('XXX', 'IMP', 2),  # 0x62
+    ('XXX', 'IMP', 8),  # 0x63
+    ('XXX', 'IMP', 3),  # 0x64
+    ('ADC', 'ZP0', 3),  # 0x65
+    ('ROR', 'ZP0', 5),  # 0x66
+    ('XXX', 'IMP', 5),  # 0x67
+    ('PLA', 'IMP', 4),  # 0x68
+    ('ADC', 'IMM', 2),  # 0x69
+    ('ROR', 'IMP', 2),  # 0x6A
+    ('XXX', 'IMP', 2),  # 0x6B
+    ('JMP', 'IND', 5),  # 0x6C
+    ('ADC', 'ABS', 4),  # 0x6D
+    ('ROR', 'ABS', 6),  # 0x6E
+    ('XXX', 'IMP', 6),  # 0x6F
+    ('BVS', 'REL', 2),  # 0x70
+    ('ADC', 'IZY', 5),  # 0x71
+    ('XXX', 'IMP', 2),  # 0x72
+    ('XXX', 'IMP', 8),  # 0x73
+    ('XXX', 'IMP', 4),  # 0x74
+    ('ADC', 'ZPX', 4),  # 0x75
+    ('ROR', 'ZPX', 6),  # 0x76
+    ('XXX', 'IMP', 6),  # 0x77
+    ('SEI', 'IMP', 2),  # 0x78
+    ('ADC', 'ABY', 4),  # 0x79
+    ('XXX', 'IMP', 2),  # 0x7A
+    ('XXX', 'IMP', 7),  # 0x7B
+    ('XXX', 'IMP', 4),  # 0x7C
+    ('ADC', 'ABX', 4),  # 0x7D
+    ('ROR', 'ABX', 7),  # 0x7E
+    ('XXX', 'IMP', 7),  # 0x7F
+    ('XXX', 'IMP', 2),  # 0x80
+    ('STA', 'IZX', 6),  # 0x81
+    ('XXX', 'IMP', 2),  # 0x82
+    ('XXX', 'IMP', 6),  # 0x83
+    ('STY', 'ZP0', 3),  # 0x84
+    ('STA', 'ZP0', 3),  # 0x85
+    ('STX', 'ZP0', 3),  # 0x86
+    ('XXX', 'IMP', 3),  # 0x87
+    ('DEY', 'IMP', 2),  # 0x88
+    ('XXX', 'IMP', 2),  # 0x89
+    ('TXA', 'IMP', 2),  # 0x8A
+    ('XXX', 'IMP', 2),  # 0x8B
+    ('STY', 'ABS', 4),  # 0x8C
+    ('STA', 'ABS', 4),  # 0x8D
+    ('STX', 'ABS', 4),  # 0x8E
+    ('XXX', 'IMP', 4),  # 0x8F
+    ('BCC', 'REL', 2),  # 0x90
+    ('STA', 'IZY', 6),  # 0x91
+    ('XXX', 'IMP', 2),  # 0x92
+    ('XXX', 'IMP', 6),  # 0x93
+    ('STY', 'ZPX', 4),  # 0x94
+    ('STA', 'ZPX', 4),  # 0x95
+    ('STX', 'ZPY', 4),  # 0x96
+    ('XXX', 'IMP', 4),  # 0x97
+    ('TYA', 'IMP', 2),  # 0x98
+    ('STA', 'ABY', 5),  # 0x99
+    ('TXS', 'IMP', 2),  # 0x9A
+    ('XXX', 'IMP', 5),  # 0x9B
+    ('XXX', 'IMP', 5),  # 0x9C
+    ('STA', 'ABX', 5),  # 0x9D
+    ('XXX', 'IMP', 5),  # 0x9E
+    ('XXX', 'IMP', 5),  # 0x9F
+    ('LDY', 'IMM', 2),  # 0xA0
+    ('LDA', 'IZX', 6),  # 0xA1
+    ('LDX', 'IMM', 2),  # 0xA2
+    ('XXX', 'IMP', 6),  # 0xA3
+    ('LDY', 'ZP0', 3),  # 0xA4
+    ('LDA', 'ZP0', 3),  # 0xA5
+    ('LDX', 'ZP0', 3),  # 0xA6
+    ('XXX', 'IMP', 3),  # 0xA7
+    ('TAY', 'IMP', 2),  # 0xA8
+    ('LDA', 'IMM', 2),  # 0xA9
+    ('TAX', 'IMP', 2),  # 0xAA
+    ('XXX', 'IMP', 2),  # 0xAB
+    ('LDY', 'ABS', 4),  # 0xAC
+    ('LDA', 'ABS', 4),  # 0xAD
+    ('LDX', 'ABS', 4),  # 0xAE
+    ('XXX', 'IMP', 4),  # 0xAF
+    ('BCS', 'REL', 2),  # 0xB0
+    ('LDA', 'IZY', 5),  # 0xB1
+    ('XXX', 'IMP', 2),  # 0xB2
+    ('XXX', 'IMP', 5),  # 0xB3
+    ('LDY', 'ZPX', 4),  # 0xB4
+    ('LDA', 'ZPX', 4),  # 0xB5
+    ('LDX', 'ZPY', 4),  # 0xB6
+    ('XXX', 'IMP', 4),  # 0xB7
+    ('CLV', 'IMP', 2),  # 0xB8
+    ('LDA', 'ABY', 4),  # 0xB9
+    ('TSX', 'IMP', 2),  # 0xBA
+    ('XXX', 'IMP', 4),  # 0xBB
+    ('LDY', 'ABX', 4),  # 0xBC
+    ('LDA', 'ABX', 4),  # 0xBD
+    ('LDX', 'ABY', 4),  # 0xBE
+    ('XXX', 'IMP', 4),  # 0xBF
+    ('CPY', 'IMM', 2),  # 0xC0
+    ('CMP', 'IZX', 6),  # 0xC1
+    ('XXX', 'IMP', 2),  # 0xC2
+    ('XXX', 'IMP', 8),  # 0xC3
+    ('CPY', 'ZP0', 3),  # 0xC4
+    ('CMP', 'ZP0', 3),  # 0xC5
+    ('DEC', 'ZP0', 5),  # 0xC6
+    ('XXX', 'IMP', 5),  # 0xC7
+    ('INY', 'IMP', 2),  # 0xC8
+    ('CMP', 'IMM', 2),  # 0xC9
+    ('DEX', 'IMP', 2),  # 0xCA
+    ('XXX', 'IMP', 2),  # 0xCB
+    ('CPY', 'ABS', 4),  # 0xCC
+    ('CMP', 'ABS', 4),  # 0xCD
+    ('DEC', 'ABS', 6),  # 0xCE
+    ('XXX', 'IMP', 6),  # 0xCF
+    ('BNE', 'REL', 2),  # 0xD0
+    ('CMP', 'IZY', 5),  # 0xD1
+    ('XXX', 'IMP', 2),  # 0xD2
+    ('XXX', 'IMP', 8),  # 0xD3
+    ('XXX', 'IMP', 4),  # 0xD4
+    ('CMP', 'ZPX', 4),  # 0xD5
+    ('DEC', 'ZPX', 6),  # 0xD6
+    ('XXX', 'IMP', 6),  # 0xD7
+    ('CLD', 'IMP', 2),  # 0xD8
+    ('CMP', 'ABY', 4),  # 0xD9
+    ('NOP', 'IMP', 2),  # 0xDA
+    ('XXX', 'IMP', 7),  # 0xDB
+    ('XXX', 'IMP', 4),  # 0xDC
+    ('CMP', 'ABX', 4),  # 0xDD
+    ('DEC', 'ABX', 7),  # 0xDE
+    ('XXX', 'IMP', 7),  # 0xDF
+    ('CPX', 'IMM', 2),  # 0xE0
+    ('SBC', 'IZX', 6),  # 0xE1
+    ('XXX', 'IMP', 2),  # 0xE2
+    ('XXX', 'IMP', 8),  # 0xE3
+    ('CPX', 'ZP0', 3),  # 0xE4
+    ('SBC', 'ZP0', 3),  # 0xE5
+    ('INC', 'ZP0', 5),  # 0xE6
+    ('XXX', 'IMP', 5),  # 0xE7
+    ('INX', 'IMP', 2),  # 0xE8
+    ('SBC', 'IMM', 2),  # 0xE9
+    ('NOP', 'IMP', 2),  # 0xEA
+    ('XXX', 'IMP', 2),  # 0xEB
+    ('CPX', 'ABS', 4),  # 0xEC
+    ('SBC', 'ABS', 4),  # 0xED
+    ('INC', 'ABS', 6),  # 0xEE
+    ('XXX', 'IMP', 6),  # 0xEF
+    ('BEQ', 'REL', 2),  # 0xF0
+    ('SBC', 'IZY', 5),  # 0xF1
+    ('XXX', 'IMP', 2),  # 0xF2
+    ('XXX', 'IMP', 8),  # 0xF3
+    ('XXX', 'IMP', 4),  # 0xF4
+    ('SBC', 'ZPX', 4),  # 0xF5
+    ('INC', 'ZPX', 6),  # 0xF6
+    ('XXX', 'IMP', 6),  # 0xF7
+    ('SED', 'IMP', 2),  # 0xF8
+    ('SBC', 'ABY', 4),  # 0xF9
+    ('NOP', 'IMP', 2),  # 0xFA
+    ('XXX', 'IMP', 7),  # 0xFB
+    ('XXX', 'IMP', 4),  # 0xFC
+    ('SBC', 'ABX', 4),  # 0xFD
+    ('INC', 'ABX', 7),  # 0xFE
+    ('XXX', 'IMP', 7),  # 0xFF
+]
+
+
+def build_lookup(cls):
+    return [Instruction(name, getattr(cls, name), getattr(cls, mode), cycles)
+            for name, mode, cycles in OPCODES]
+
+
+CPU.lookup = build_lookup(CPU)
+
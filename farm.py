@@ -0,0 +1,136 @@
+# farm runner: runs a manifest of ROM images / test vectors across all cores
+#
+#   python farm.py jobs.json [-j WORKERS]
+#
+# the manifest is JSON, either a list of jobs or {"jobs": [...]}:
+#
+#   {"name": "vector-17",
+#    "rom": "roms/game.bin", "load": "$0000",        # image, and where a raw one goes
+#    "memory": {"$0080": "01ff"},                     # optional extra bytes (hex)
+#    "registers": {"pc": "$0200", "a": 1},            # optional, applied after reset()
+#    "stop": {"pc": "$0300"} or "brk",                # optional stop condition
+#    "cycles": 1000000,                               # cycle limit
+#    "engine": "interpreter" | "fastloop" | "translator"}
+#
+# ROMs can be raw binaries, Intel HEX or Atari .xex files (see loader); a
+# start address in the file sets the reset vector. Jobs go to a
+# ProcessPoolExecutor as small dicts (the ROM is read by the worker, and
+# cached there), and each result is printed as one JSON line as soon as its
+# job finishes.
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+
+import emulator as emu
+import loader
+
+REGISTER_NAMES = ('a', 'x', 'y', 'sp', 'pc', 'p')
+
+
+def number(value):
+    # 4660, "4660", "$1234" or "0x1234"
+    if isinstance(value, int):
+        return value
+    value = value.strip()
+    if value.startswith('$'):
+        return int(value[1:], 16)
+    return int(value, 0)
+
+
+def run_job(job):
+    cpu = emu.CPU()
+    if 'rom' in job:
+        loader.load_file(cpu, job['rom'], number(job.get('load', 0)))
+    for address, data in job.get('memory', {}).items():
+        cpu.bus.load(number(address), bytes.fromhex(data))
+    cpu.reset()
+    for name, value in job.get('registers', {}).items():
+        if name not in REGISTER_NAMES:
+            raise ValueError('unknown register {!r}'.format(name))
+        setattr(cpu, name, number(value))
+
+    limit = number(job.get('cycles', 1000000))
+    stop = job.get('stop')
+    stop_pc = number(stop['pc']) if isinstance(stop, dict) and 'pc' in stop else None
+
+    if stop_pc is not None:
+        # needs a check after every instruction, so always on the interpreter
+        step = cpu.step
+        end = cpu.clock_count + limit
+        while cpu.clock_count < end and not cpu.halt and cpu.pc != stop_pc:
+            step()
+    else:
+        engine = job.get('engine', 'interpreter')
+        if engine == 'interpreter':
+            cpu.run(cycles=limit)
+        elif engine == 'fastloop':
+            import fastloop
+            fastloop.run(cpu, cycles=limit)
+        elif engine == 'translator':
+            import translator
+            translator.BlockTranslator(cpu).run(limit)
+        else:
+            raise ValueError('unknown engine {!r}'.format(engine))
+
+    if cpu.halt:
+        reason = 'brk'
+    elif stop_pc is not None and cpu.pc == stop_pc:
+        reason = 'pc'
+    else:
+        reason = 'cycles'
+    return {
+        'name': job.get('name'),
+        'stopped': reason,
+        'registers': {name: getattr(cpu, name) for name in REGISTER_NAMES},
+        'clock_count': cpu.clock_count,
+        'memory_sha1': hashlib.sha1(cpu.bus.ram).hexdigest(),
+    }
+
+
+def safe_run_job(job):
+    try:
+        return run_job(job)
+    except Exception as e:
+        return {'name': job.get('name'), 'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def run_jobs(jobs, workers=None):
+    # yields results in completion order
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(safe_run_job, job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    jobs = manifest['jobs'] if isinstance(manifest, dict) else manifest
+    # ROM paths are relative to the manifest
+    base = os.path.dirname(os.path.abspath(path))
+    for job in jobs:
+        if 'rom' in job:
+            job['rom'] = os.path.join(base, job['rom'])
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run 6502 jobs across a process pool')
+    parser.add_argument('manifest')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for result in run_jobs(load_manifest(args.manifest), args.workers):
+        failed += 'error' in result
+        print(json.dumps(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
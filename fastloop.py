@@ -0,0 +1,163 @@
+# generated interpreter
+# builds one large run() function per CPU class from its decode table:
+# every opcode's addressing mode and operator are inlined by codegen, the
+# opcode is dispatched through a binary tree of comparisons, and the
+# registers live in locals for the whole run and are stored back on exit.
+# cycles are charged straight against the budget, and clock_count is worked
+# out from how much of the budget was used.
+# behaves like CPU.run(), including the cycle carry-over in cpu.budget.
+#
+#   import fastloop
+#   fastloop.run(cpu, cycles=1000000)
+
+import ast
+import builtins
+
+import codegen
+
+_runners = {}
+
+# registers held in locals by the generated loop; the methods' 'cycles'
+# adjustments become budget adjustments
+REGISTERS = [name for name in codegen.REGISTERS if name != 'cycles']
+
+PROLOGUE = '''\
+def make({names}):
+ def run(cpu, cycles_limit=None, instructions=None):
+  if cycles_limit is None and instructions is None:
+   raise ValueError('run() needs cycles or instructions')
+  if cpu.tracer is not None or cpu.profiler is not None:
+   return cpu.run(cycles_limit, instructions)
+  read = cpu.read
+  write = cpu.write
+{loads}
+  opcode = cpu.opcode
+  budget = start = 1 << 62 if cycles_limit is None else cpu.budget + cycles_limit
+  limit = -1 if instructions is None else instructions
+  executed = 0
+  if budget > 0 and limit != 0 and not halt:
+   # cycles still owed by reset() or clock() go to the first instruction
+   budget -= cpu.cycles
+   while True:
+    opcode = read(pc)
+    pc += 1'''
+
+EPILOGUE = '''\
+    executed += 1
+    if budget <= 0 or executed == limit:
+     break
+{stores}
+  if executed:
+   cpu.opcode = opcode
+   cpu.current_byte = lookup[opcode]
+   cpu.clock_count += start - budget
+   cpu.cycles = 0
+  if cycles_limit is not None:
+   cpu.budget = budget
+  return executed
+ return run'''
+
+
+def dispatch(opcodes, bodies, indent):
+    # binary tree of 'if opcode < n' over a sorted run of opcodes
+    if len(opcodes) == 1:
+        return bodies[opcodes[0]](indent)
+    pad = ' ' * indent
+    middle = len(opcodes) // 2
+    lines = [pad + 'if opcode < {}:'.format(opcodes[middle])]
+    lines.extend(dispatch(opcodes[:middle], bodies, indent + 1))
+    lines.append(pad + 'else:')
+    lines.extend(dispatch(opcodes[middle:], bodies, indent + 1))
+    return lines
+
+
+class ChargeBudget(ast.NodeTransformer):
+    # cycles += n  ->  budget -= n
+    def visit_AugAssign(self, node):
+        if isinstance(node.target, ast.Name) and node.target.id == 'cycles':
+            op = ast.Sub() if isinstance(node.op, ast.Add) else ast.Add()
+            return ast.AugAssign(ast.Name('budget', ast.Store()), op, node.value)
+        return self.generic_visit(node)
+
+
+def opcode_body(opcode, instruction, compiled):
+    def body(indent):
+        pad = ' ' * indent
+        lines = [pad + '# {} {}'.format(instruction.name, instruction.mode),
+                 pad + 'budget -= {}'.format(instruction.cycles)]
+        if compiled is None:
+            # the inliner can't handle it: hand the instruction to the methods
+            lines.extend(pad + 'cpu.{0} = {0}'.format(name) for name in REGISTERS)
+            lines.append(pad + 'cpu.cycles = 0')
+            lines.append(pad + 'lookup[{0}].addr_mode(cpu)'.format(opcode))
+            lines.append(pad + 'lookup[{0}].operator(cpu)'.format(opcode))
+            lines.extend(pad + '{0} = cpu.{0}'.format(name) for name in REGISTERS)
+            lines.append(pad + 'budget -= cpu.cycles')
+            lines.append(pad + 'if halt:')
+            lines.append(pad + ' executed += 1')
+            lines.append(pad + ' break')
+            return lines
+        for stmt in compiled.statements:
+            stmt = ast.fix_missing_locations(ChargeBudget().visit(stmt))
+            lines.extend(pad + line for line in ast.unparse(stmt).splitlines())
+        if 'halt' in codegen.used_registers(compiled.statements)[1]:
+            lines.append(pad + 'if halt:')
+            lines.append(pad + ' executed += 1')
+            lines.append(pad + ' break')
+        return lines
+    return body
+
+
+def free_names(statements):
+    # globals the inlined code refers to (NZ, C, ...), bound as closure cells
+    names = set()
+    for stmt in statements:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) \
+                    and node.id not in codegen.REGISTERS and not node.id.startswith('_') \
+                    and node.id not in ('read', 'write'):
+                names.add(node.id)
+    return names
+
+
+def generate(cls):
+    # returns the source of make(<globals>) -> run, and the names make() takes
+    names = {'lookup'}
+    bodies = {}
+    for opcode, instruction in enumerate(cls.lookup):
+        try:
+            compiled = codegen.compile_instruction(cls, opcode)
+            names |= free_names(compiled.statements)
+        except codegen.Unsupported:
+            compiled = None
+        bodies[opcode] = opcode_body(opcode, instruction, compiled)
+
+    names = sorted(names)
+    lines = [PROLOGUE.format(
+        names=', '.join(names),
+        loads='\n'.join('  {0} = cpu.{0}'.format(name) for name in REGISTERS))]
+    lines.extend(dispatch(list(range(256)), bodies, 4))
+    lines.append(EPILOGUE.format(
+        stores='\n'.join('  cpu.{0} = {0}'.format(name) for name in REGISTERS)))
+    return '\n'.join(lines), names
+
+
+def build(cls):
+    runner = _runners.get(cls)
+    if runner is None:
+        source, names = generate(cls)
+        namespace = dict(vars(builtins))
+        for instruction in cls.lookup:
+            namespace.update(instruction.addr_mode.__globals__)
+            namespace.update(instruction.operator.__globals__)
+        namespace['lookup'] = cls.lookup
+        code = {}
+        exec(compile(source, '<fastloop {}>'.format(cls.__name__), 'exec'), code)
+        runner = code['make'](*[namespace[name] for name in names])
+        runner.source = source
+        _runners[cls] = runner
+    return runner
+
+
+def run(cpu, cycles=None, instructions=None):
+    return build(type(cpu))(cpu, cycles, instructions)
@@ -0,0 +1,321 @@
+# GDB remote serial protocol stub
+# serves one CPU to a debugger over a localhost TCP socket:
+#   ? g G p P       stop reason, registers
+#   m M X           memory, as bulk Bus.dump()/Bus.load() slices; devices are
+#                   not read, so inspecting memory has no side effects
+#   Z/z 0-4         breakpoints and write/read/access watchpoints (debugger.py)
+#   c s             continue and single step, optionally from an address
+#   ^C              interrupt a continue
+#   k D             kill / detach
+# registers go in the order a, x, y, sp, p (a byte each), then pc (16 bits,
+# little endian).
+#
+# 'continue' runs Debugger.run() in chunks of `chunk` cycles and only checks
+# the socket between chunks, so with no breakpoints set the CPU runs on its
+# normal fast path and a ^C is seen within one chunk.
+#
+#   python gdbstub.py --load game.xex --port 1234
+#   (gdb) target remote localhost:1234
+
+import argparse
+import select
+import socket
+import sys
+
+import debugger
+import emulator as emu
+import loader
+from farm import number
+
+REGISTER_SIZES = (('a', 1), ('x', 1), ('y', 1), ('sp', 1), ('p', 1), ('pc', 2))
+REGISTER_BYTES = sum(size for _, size in REGISTER_SIZES)
+
+SIGINT = 2
+SIGTRAP = 5
+
+
+class GDBServer:
+    def __init__(self, cpu, host='127.0.0.1', port=1234, chunk=100000):
+        self.cpu = cpu
+        self.debugger = debugger.Debugger(cpu)
+        self.host = host
+        self.port = port
+        self.chunk = chunk
+        self.connection = None
+        self.received = bytearray()
+        self.ack = True
+        self.last_stop = 'S{:02x}'.format(SIGTRAP)
+
+    def serve(self, listener=None):
+        # accept one debugger and serve it until it detaches or disconnects
+        if listener is None:
+            listener = socket.create_server((self.host, self.port))
+        with listener:
+            connection, _ = listener.accept()
+        with connection:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connection = connection
+            self.received.clear()
+            self.ack = True
+            try:
+                while True:
+                    packet = self.read_packet()
+                    if packet is None:
+                        break
+                    reply = self.handle(packet)
+                    if reply is None:
+                        break
+                    self.send(reply)
+                    if packet == b'QStartNoAckMode':
+                        self.ack = False
+            except ConnectionError:
+                pass    # the debugger went away mid-reply
+        self.connection = None
+
+    # framing
+
+    def receive(self):
+        data = self.connection.recv(65536)
+        if not data:
+            return False
+        self.received += data
+        return True
+
+    def read_packet(self):
+        # the next packet's payload as bytes; a bare ^C reads as b'\x03'
+        received = self.received
+        while True:
+            while received[:1] in (b'+', b'-'):
+                del received[0]
+            if received[:1] == b'\x03':
+                del received[0]
+                return b'\x03'
+            start = received.find(b'$')
+            end = received.find(b'#', start + 1) if start >= 0 else -1
+            if end >= 0 and len(received) >= end + 3:
+                payload = bytes(received[start + 1:end])
+                checksum = received[end + 1:end + 3]
+                del received[:end + 3]
+                if self.ack:
+                    try:
+                        valid = int(checksum, 16) == sum(payload) & 0xFF
+                    except ValueError:
+                        valid = False
+                    self.connection.sendall(b'+' if valid else b'-')
+                    if not valid:
+                        continue
+                return unescape(payload)
+            if start > 0:
+                del received[:start]
+            if not self.receive():
+                return None
+
+    def send(self, reply):
+        data = reply.encode('latin-1') if isinstance(reply, str) else reply
+        self.connection.sendall(b'$' + data + b'#' + '{:02x}'.format(sum(data) & 0xFF).encode())
+        # the ack ('+') is skipped over by read_packet()
+
+    def interrupted(self):
+        # a ^C waiting on the socket; never blocks
+        if self.received[:1] != b'\x03':
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            if readable and not self.receive():
+                return True     # debugger went away
+        while self.received[:1] in (b'+', b'-'):
+            del self.received[0]
+        if self.received[:1] == b'\x03':
+            del self.received[0]
+            return True
+        return False
+
+    # packets
+
+    def handle(self, packet):
+        # returns the reply, or None to end the session; a packet that
+        # doesn't parse gets E01 rather than ending it
+        if not packet:
+            return ''
+        try:
+            return self.dispatch(packet)
+        except ValueError:
+            return 'E01'
+
+    def dispatch(self, packet):
+        command, body = chr(packet[0]), packet[1:].decode('latin-1')
+        cpu = self.cpu
+        if packet == b'\x03':
+            return self.stop(SIGINT)
+        if command == '?':
+            return self.last_stop
+        if command == 'g':
+            return self.registers().hex()
+        if command == 'G':
+            self.set_registers(bytes.fromhex(body))
+            return 'OK'
+        if command == 'p':
+            index = int(body, 16)
+            if not 0 <= index < len(REGISTER_SIZES):
+                return 'E00'
+            name, size = REGISTER_SIZES[index]
+            return (getattr(cpu, name) & ((1 << 8 * size) - 1)).to_bytes(size, 'little').hex()
+        if command == 'P':
+            index, value = body.split('=')
+            index = int(index, 16)
+            if not 0 <= index < len(REGISTER_SIZES):
+                return 'E00'
+            name, size = REGISTER_SIZES[index]
+            value = bytes.fromhex(value)
+            if len(value) != size:
+                return 'E01'
+            setattr(cpu, name, int.from_bytes(value, 'little'))
+            return 'OK'
+        if command == 'm':
+            address, length = [int(field, 16) for field in body.split(',')]
+            if not 0 <= address < emu.Bus.SIZE:
+                return 'E02'
+            return cpu.bus.dump(address, min(length, emu.Bus.SIZE - address)).hex()
+        if command in 'MX':
+            where, data = packet[1:].split(b':', 1)
+            address, length = [int(field, 16) for field in where.decode().split(',')]
+            data = bytes.fromhex(data.decode()) if command == 'M' else data
+            if len(data) != length:
+                return 'E01'
+            try:
+                cpu.bus.load(address, data)
+            except ValueError:
+                return 'E02'
+            return 'OK'
+        if command in 'Zz':
+            return self.breakpoint(command == 'Z', body)
+        if command in 'cs':
+            if body:
+                address = int(body, 16)
+                if not 0 <= address < emu.Bus.SIZE:
+                    return 'E02'
+                cpu.pc = address
+            return self.step() if command == 's' else self.resume()
+        if command == 'k':
+            return None
+        if command == 'D':
+            self.send('OK')
+            return None
+        if command == 'H' or command == 'T':
+            return 'OK'
+        if command == 'q':
+            return self.query(body)
+        if command == 'Q' and body == 'StartNoAckMode':
+            return 'OK'     # serve() stops acking after this reply
+        return ''   # not supported
+
+    def query(self, body):
+        if body.startswith('Supported'):
+            return 'PacketSize=4000;QStartNoAckMode+'
+        if body == 'Attached':
+            return '1'
+        if body == 'C':
+            return 'QC1'
+        if body == 'fThreadInfo':
+            return 'm1'
+        if body == 'sThreadInfo':
+            return 'l'
+        return ''
+
+    def registers(self):
+        cpu = self.cpu
+        return b''.join((getattr(cpu, name) & ((1 << 8 * size) - 1)).to_bytes(size, 'little')
+                        for name, size in REGISTER_SIZES)
+
+    def set_registers(self, data):
+        if len(data) != REGISTER_BYTES:
+            raise ValueError('expected {} register bytes'.format(REGISTER_BYTES))
+        offset = 0
+        for name, size in REGISTER_SIZES:
+            setattr(self.cpu, name, int.from_bytes(data[offset:offset + size], 'little'))
+            offset += size
+
+    def breakpoint(self, insert, body):
+        kind, address, length = [int(field, 16) for field in body.split(',')[:3]]
+        dbg = self.debugger
+        end = address + max(length, 1) - 1
+        if address < 0 or end >= emu.Bus.SIZE:
+            return 'E02'
+        if kind in (0, 1):
+            if insert:
+                dbg.add_breakpoint(address)
+            else:
+                dbg.remove_breakpoint(address)
+        elif kind in (2, 3, 4):
+            if insert:
+                dbg.add_watchpoint(address, end, read=kind in (3, 4), write=kind in (2, 4))
+            else:
+                dbg.remove_watchpoint(address, end)
+        else:
+            return ''
+        return 'OK'
+
+    def stop(self, signal, reason=None):
+        reply = 'S{:02x}'.format(signal)
+        if reason is not None and reason[0] in ('read', 'write'):
+            address = reason[1]
+            flags = self.debugger.watch[address]
+            watch = 'awatch' if flags == debugger.READ | debugger.WRITE else \
+                'rwatch' if reason[0] == 'read' else 'watch'
+            reply = 'T{:02x}{}:{:x};'.format(signal, watch, address)
+        self.last_stop = reply
+        return reply
+
+    def step(self):
+        return self.stop(SIGTRAP, self.debugger.step())
+
+    def resume(self):
+        # run until a breakpoint, watchpoint, BRK or ^C
+        cpu = self.cpu
+        while not cpu.halt:
+            reason = self.debugger.run(cycles=self.chunk)
+            if reason is not None:
+                return self.stop(SIGTRAP, reason)
+            if self.interrupted():
+                return self.stop(SIGINT)
+        return self.stop(SIGTRAP)
+
+
+def unescape(payload):
+    # binary data escapes: '}' followed by the byte xor 0x20
+    if b'}' not in payload:
+        return payload
+    out = bytearray()
+    escaped = False
+    for byte in payload:
+        if escaped:
+            out.append(byte ^ 0x20)
+            escaped = False
+        elif byte == 0x7D:
+            escaped = True
+        else:
+            out.append(byte)
+    return bytes(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve a 6502 to gdb over TCP')
+    parser.add_argument('--load', action='append', default=[], metavar='FILE[:ADDRESS]')
+    parser.add_argument('--pc', help='start address instead of the reset vector')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    cpu = emu.CPU()
+    for spec in args.load:
+        path, _, address = spec.partition(':')
+        loader.load_file(cpu, path, number(address) if address else 0)
+    cpu.reset()
+    if args.pc is not None:
+        cpu.pc = number(args.pc)
+    server = GDBServer(cpu, args.host, args.port)
+    print('waiting for gdb on {}:{}'.format(args.host, args.port))
+    server.serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# idle-loop detection
+# a program waiting for an interrupt or for a flag in memory spins in a short
+# loop that writes nothing. Once one pass round such a loop leaves a, x, y,
+# sp and p exactly as they were, every later pass is the same pass again,
+# until something outside the CPU changes memory. With the scheduler, that
+# can only be the next event callback, so the passes up to the next deadline
+# can be skipped by adding their cycles to clock_count in one go.
+#
+# the check is a probe: a few instructions stepped on the interpreter with
+# recording read/write functions on the bus. A pass that writes, reads a
+# device page or changes a register isn't idle (a DEX/BNE delay loop, or
+# main.py's ADC/JMP loop once ADC stores its result). Probes run between
+# chunks of normal execution; the chunk doubles after every failed probe up
+# to `interval` cycles and drops back to `min_chunk` after a hit, so a busy
+# program soon pays one short probe per interval while an idle one gets back
+# to its loop after an interrupt handler and skips to the next event.
+#
+#   sched = scheduler.Scheduler(cpu, idle=idle.IdleDetector(cpu))
+
+REGISTERS = ('a', 'x', 'y', 'sp', 'p')
+
+
+class IdleDetector:
+    def __init__(self, cpu, interval=4096, min_chunk=64, probe_length=32):
+        self.cpu = cpu
+        self.interval = interval
+        self.min_chunk = min_chunk
+        self.chunk = min_chunk
+        self.probe_length = probe_length
+        self.skipped = 0        # cycles fast-forwarded so far
+
+    def probe(self, stop):
+        # step up to probe_length instructions, stopping short of clock_count
+        # stop; returns the cycles of one pass if the CPU turned out to be in
+        # an idle loop (it is then at the start of a pass), else 0
+        cpu = self.cpu
+        bus = cpu.bus
+        bus_read = bus.read
+        patched_read = bus.__dict__.get('read')     # someone else's wrapper, if any
+        read_pages = bus.read_pages
+        cpu_read, cpu_write = cpu.read, cpu.write
+        side_effects = []
+
+        def read(address):
+            if read_pages[(address & 0xFFFF) >> 8] is not None:
+                side_effects.append(address)
+            return bus_read(address)
+
+        def write(address, data):
+            side_effects.append(address)
+            cpu_write(address, data)
+
+        start_pc = cpu.pc
+        start = tuple(getattr(cpu, name) for name in REGISTERS)
+        start_clock = cpu.clock_count
+        # fetch() reads through bus.read, so both paths are covered
+        bus.read = cpu.read = read
+        cpu.write = write
+        try:
+            for _ in range(self.probe_length):
+                if cpu.halt or cpu.clock_count >= stop:
+                    break
+                cpu.step()
+                if side_effects:
+                    break
+                if cpu.pc == start_pc and tuple(getattr(cpu, name) for name in REGISTERS) == start:
+                    return cpu.clock_count - start_clock
+        finally:
+            if patched_read is None:
+                del bus.read
+            else:
+                bus.read = patched_read
+            cpu.read, cpu.write = cpu_read, cpu_write
+        return 0
+
+    def run(self, engine, stop):
+        # run engine(cycles) up to clock_count stop, probing between chunks
+        # and skipping the whole idle passes that end by stop
+        cpu = self.cpu
+        while cpu.clock_count < stop and not cpu.halt:
+            cpu.budget = 0
+            engine(min(stop - cpu.clock_count, self.chunk))
+            if cpu.clock_count >= stop or cpu.halt \
+                    or cpu.tracer is not None or cpu.profiler is not None:
+                continue
+            period = self.probe(stop)
+            if period:
+                skip = (stop - cpu.clock_count) // period * period
+                cpu.clock_count += skip
+                self.skipped += skip
+                self.chunk = self.min_chunk
+            else:
+                self.chunk = min(self.chunk * 2, self.interval)
@@ -0,0 +1,187 @@
+# program loader for raw binaries, Intel HEX and Atari DOS executables
+# (.xex: $FFFF header, then start/end/data segments). Files are mapped with
+# mmap and parsed in place; the parsed Image (segments plus start addresses)
+# is cached per process by path, size and mtime, so loading the same ROM
+# into thousands of machines costs one slice copy per segment.
+#
+#   image = loader.read_image('game.xex')
+#   loader.load(cpu, image)             # segments into RAM, reset vector = RUN
+#   cpu.reset()
+#
+# a raw image has no load address of its own: read_image('rom.bin', 0xC000).
+# XEX INIT addresses ($02E2) are collected in image.inits, in load order;
+# running them is up to the caller.
+
+import mmap
+import os
+
+RESET_VECTOR = 0xFFFC
+RUNAD = 0x02E0      # Atari DOS run address
+INITAD = 0x02E2     # Atari DOS init address
+
+_images = {}    # (path, load address, kind) -> (size, mtime, Image)
+
+
+class Image:
+    __slots__ = ('segments', 'run', 'inits')
+
+    def __init__(self, segments, run=None, inits=()):
+        self.segments = segments    # [(address, bytes)]
+        self.run = run              # start address, or None
+        self.inits = list(inits)
+
+    def size(self):
+        return sum(len(data) for _, data in self.segments)
+
+
+def parse_raw(data, address=0):
+    if address + len(data) > 0x10000:
+        raise ValueError('{} byte image at ${:04X} runs past $FFFF'.format(len(data), address))
+    return Image([(address, bytes(data))])
+
+
+def parse_hex(data):
+    # Intel HEX: data (00), end of file (01), extended segment/linear
+    # address (02/04) and start address (03/05) records
+    segments = []
+    run = None
+    base = 0
+    current = None      # [start, bytearray] being extended
+    # an mmap is read line by line rather than copied whole
+    lines = iter(data.readline, b'') if hasattr(data, 'readline') else bytes(data).splitlines()
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith(b':'):
+            raise ValueError('line {}: not an Intel HEX record'.format(number))
+        record = bytes.fromhex(line[1:].decode('ascii'))
+        if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+            raise ValueError('line {}: bad length or checksum'.format(number))
+        count, kind, payload = record[0], record[3], record[4:4 + record[0]]
+        offset = (record[1] << 8) | record[2]
+
+        if kind == 0x00:
+            address = base + offset
+            if address + count > 0x10000:
+                raise ValueError('line {}: data at ${:X} is outside the 6502 address space'.format(number, address))
+            if current is not None and current[0] + len(current[1]) == address:
+                current[1] += payload
+            else:
+                current = [address, bytearray(payload)]
+                segments.append(current)
+        elif kind == 0x01:
+            break
+        elif kind == 0x02:
+            base = int.from_bytes(payload, 'big') << 4
+        elif kind == 0x04:
+            base = int.from_bytes(payload, 'big') << 16
+        elif kind in (0x03, 0x05):
+            value = int.from_bytes(payload, 'big')
+            run = (((value >> 16) << 4) + (value & 0xFFFF)) & 0xFFFF if kind == 0x03 else value & 0xFFFF
+        else:
+            raise ValueError('line {}: unknown record type {:02X}'.format(number, kind))
+    return Image([(address, bytes(block)) for address, block in segments], run)
+
+
+def parse_xex(data):
+    # segments of start, end (inclusive, little endian) and data; a $FFFF
+    # marker may precede any of them. Writes to RUNAD/INITAD give the start
+    # and init addresses.
+    # the view is released on return so an mmap can be closed
+    with memoryview(data) as view:
+        return xex_segments(view)
+
+
+def xex_segments(view):
+    segments = []
+    run = None
+    inits = []
+    position = 0
+    if bytes(view[:2]) != b'\xff\xff':
+        raise ValueError('not an Atari executable (no $FFFF header)')
+    while position < len(view):
+        if bytes(view[position:position + 2]) == b'\xff\xff':
+            position += 2
+            continue
+        if position + 4 > len(view):
+            raise ValueError('truncated segment header at offset {}'.format(position))
+        start = view[position] | (view[position + 1] << 8)
+        end = view[position + 2] | (view[position + 3] << 8)
+        position += 4
+        if end < start or position + end - start + 1 > len(view):
+            raise ValueError('bad segment ${:04X}-${:04X}'.format(start, end))
+        segment = bytes(view[position:position + end - start + 1])
+        position += len(segment)
+        segments.append((start, segment))
+
+        # run/init addresses carried by this segment
+        for vector in (RUNAD, INITAD):
+            if start <= vector and vector + 1 <= end:
+                value = segment[vector - start] | (segment[vector - start + 1] << 8)
+                if vector == RUNAD:
+                    run = value
+                else:
+                    inits.append(value)
+    return Image(segments, run, inits)
+
+
+def detect(path, data):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.hex', '.ihx', '.ihex'):
+        return 'hex'
+    if extension in ('.xex', '.com', '.exe', '.obj'):
+        return 'xex'
+    if extension in ('.bin', '.rom', '.raw'):
+        return 'raw'
+    if bytes(data[:2]) == b'\xff\xff':
+        return 'xex'
+    if bytes(data[:1]) == b':':
+        return 'hex'
+    return 'raw'
+
+
+def read_image(path, address=0, kind=None):
+    # parse a file (cached); address is where a raw image goes
+    stat = os.stat(path)
+    key = (os.path.abspath(path), address, kind)
+    cached = _images.get(key)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    with open(path, 'rb') as f:
+        if stat.st_size:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = b''
+        try:
+            kind = kind or detect(path, data)
+            if kind == 'raw':
+                image = parse_raw(data, address)
+            elif kind == 'hex':
+                image = parse_hex(data)
+            elif kind == 'xex':
+                image = parse_xex(data)
+            else:
+                raise ValueError('unknown image type {!r}'.format(kind))
+        finally:
+            if stat.st_size:
+                data.close()
+
+    _images[key] = (stat.st_size, stat.st_mtime_ns, image)
+    return image
+
+
+def load(cpu, image, set_vectors=True):
+    # copy the segments into memory and point the reset vector at the start
+    # address, if the image has one
+    bus = cpu.bus
+    for address, data in image.segments:
+        bus.load(address, data)
+    if set_vectors and image.run is not None:
+        bus.load(RESET_VECTOR, image.run.to_bytes(2, 'little'))
+    return image
+
+
+def load_file(cpu, path, address=0, kind=None, set_vectors=True):
+    return load(cpu, read_image(path, address, kind), set_vectors)
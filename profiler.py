@@ -0,0 +1,96 @@
+# execution profiler
+# counts executions and cycles per opcode and per pc, the extra cycles for
+# page crossings in ABX/ABY/IZY addressing, taken branches, and entries and
+# cycles per basic block (a block starts at the first instruction after a
+# jump, branch, return or interrupt). CPU.run() only switches to the
+# profiled step while a profiler is set, so leaving it off costs nothing.
+#
+#   profile = profiler.Profiler()
+#   cpu.set_profiler(profile)
+#   cpu.run(cycles=1000000)
+#   print(profile.report(cpu.lookup))
+
+import array
+
+from codegen import ENDS_BLOCK
+
+
+class Profiler:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.opcode_counts = array.array('Q', bytes(8 * 256))
+        self.opcode_cycles = array.array('Q', bytes(8 * 256))
+        self.page_crossings = array.array('Q', bytes(8 * 256))     # per opcode
+        self.branches_taken = array.array('Q', bytes(8 * 256))     # per opcode
+        self.pc_counts = array.array('Q', bytes(8 * 0x10000))
+        self.pc_cycles = array.array('Q', bytes(8 * 0x10000))
+        self.block_entries = {}     # block start -> times entered
+        self.block_cycles = {}      # block start -> cycles spent in the block
+        self.block = None           # start of the block being executed
+        self.ends_block = True
+
+    def record(self, pc, instruction, opcode, spent, mode_cycles, operator_cycles):
+        # mode_cycles / operator_cycles: what the addressing mode and the
+        # operator added on top of the base cycles
+        self.opcode_counts[opcode] += 1
+        self.opcode_cycles[opcode] += spent
+        self.pc_counts[pc] += 1
+        self.pc_cycles[pc] += spent
+        if mode_cycles:
+            self.page_crossings[opcode] += 1
+
+        if self.ends_block:
+            self.block = pc
+            self.block_entries[pc] = self.block_entries.get(pc, 0) + 1
+        self.block_cycles[self.block] = self.block_cycles.get(self.block, 0) + spent
+        self.ends_block = instruction.name in ENDS_BLOCK
+        if self.ends_block and operator_cycles and instruction.mode == 'REL':
+            self.branches_taken[opcode] += 1
+
+    def interrupted(self):
+        # the next instruction starts a block (interrupt entry)
+        self.ends_block = True
+
+    def by_instruction(self, lookup):
+        # (name, mode) -> [count, cycles, page crossings, branches taken]
+        totals = {}
+        for opcode, instruction in enumerate(lookup):
+            if self.opcode_counts[opcode]:
+                entry = totals.setdefault((instruction.name, instruction.mode), [0, 0, 0, 0])
+                entry[0] += self.opcode_counts[opcode]
+                entry[1] += self.opcode_cycles[opcode]
+                entry[2] += self.page_crossings[opcode]
+                entry[3] += self.branches_taken[opcode]
+        return totals
+
+    def top_instructions(self, lookup, n=10):
+        totals = self.by_instruction(lookup)
+        return sorted(((key,) + tuple(value) for key, value in totals.items()),
+                      key=lambda row: row[2], reverse=True)[:n]
+
+    def top_pcs(self, n=10):
+        # (pc, count, cycles), most cycles first
+        cycles = self.pc_cycles
+        hot = sorted((pc for pc in range(0x10000) if cycles[pc]), key=cycles.__getitem__, reverse=True)
+        return [(pc, self.pc_counts[pc], cycles[pc]) for pc in hot[:n]]
+
+    def top_blocks(self, n=10):
+        # (start, entries, cycles), most cycles first
+        hot = sorted(self.block_cycles.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(start, self.block_entries.get(start, 0), cycles) for start, cycles in hot]
+
+    def report(self, lookup, n=10):
+        total = sum(self.opcode_cycles) or 1
+        lines = ['instruction   count        cycles      %    page-x   taken']
+        for (name, mode), count, cycles, crossings, taken in self.top_instructions(lookup, n):
+            lines.append('{} {:4} {:>12} {:>12} {:5.1f} {:>8} {:>7}'.format(
+                name, mode, count, cycles, 100 * cycles / total, crossings, taken))
+        lines.append('pc            count        cycles      %')
+        for pc, count, cycles in self.top_pcs(n):
+            lines.append('${:04X}    {:>12} {:>12} {:5.1f}'.format(pc, count, cycles, 100 * cycles / total))
+        lines.append('block       entries        cycles      %')
+        for start, entries, cycles in self.top_blocks(n):
+            lines.append('${:04X}    {:>12} {:>12} {:5.1f}'.format(start, entries, cycles, 100 * cycles / total))
+        return '\n'.join(lines)
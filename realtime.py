@@ -0,0 +1,90 @@
+# real-time runner
+# runs the CPU at a fixed clock rate under asyncio: whole-instruction slices
+# of `slice_cycles` (one video frame by default), each followed by an
+# asyncio.sleep() until the wall-clock time the slice should have taken, so
+# other coroutines (I/O, a monitor, metrics) run in the gaps.
+#
+# progress is measured against a fixed start time rather than slice by
+# slice, so sleeps that wake late don't add up. A slice finished after its
+# deadline counts as missed, and the runner only yields; when it falls more
+# than max_lag behind it stops trying to catch up and starts counting from
+# now again (a resync).
+#
+#   runner = realtime.RealTime(cpu)                 # 1.79 MHz, 60 Hz slices
+#   runner = realtime.RealTime(cpu, run=sched.run)  # with timed events
+#   await runner.run(seconds=10)
+#   print(runner.report())
+
+import asyncio
+
+NTSC_CLOCK = 1789773    # Atari 8-bit NTSC CPU clock, Hz
+FRAME_RATE = 60
+
+
+class RealTime:
+    def __init__(self, cpu, hz=NTSC_CLOCK, slice_cycles=None, run=None, max_lag=0.25):
+        self.cpu = cpu
+        self.hz = hz
+        self.slice_cycles = slice_cycles or hz // FRAME_RATE
+        self.engine = cpu.run if run is None else run   # engine(cycles)
+        self.max_lag = max_lag      # seconds behind before giving up on catching up
+        self.running = False
+
+        self.slices = 0
+        self.missed = 0         # slices that finished after their deadline
+        self.resyncs = 0
+        self.drift = 0.0        # seconds behind (+) or ahead (-) after the last slice
+        self.max_drift = 0.0
+        self.busy = 0.0         # wall time spent emulating
+        self.emulated = 0       # cycles run
+
+    def stop(self):
+        # ends run() after the current slice
+        self.running = False
+
+    async def run(self, seconds=None, cycles=None):
+        # run until stop(), the CPU halts, or the given emulated time is up
+        cpu = self.cpu
+        loop = asyncio.get_running_loop()
+        end = None
+        if seconds is not None:
+            cycles = int(seconds * self.hz)
+        if cycles is not None:
+            end = cpu.clock_count + cycles
+
+        start_time = loop.time()
+        start_clock = cpu.clock_count
+        self.running = True
+        while self.running and not cpu.halt and (end is None or cpu.clock_count < end):
+            count = self.slice_cycles if end is None else min(self.slice_cycles, end - cpu.clock_count)
+            before = loop.time()
+            clock = cpu.clock_count
+            self.engine(count)
+            now = loop.time()
+            self.busy += now - before
+            self.emulated += cpu.clock_count - clock
+            self.slices += 1
+
+            deadline = start_time + (cpu.clock_count - start_clock) / self.hz
+            self.drift = now - deadline
+            self.max_drift = max(self.max_drift, self.drift)
+            if now <= deadline:
+                await asyncio.sleep(deadline - now)
+                continue
+
+            self.missed += 1
+            if self.drift > self.max_lag:
+                start_time = now
+                start_clock = cpu.clock_count
+                self.resyncs += 1
+            # still give the other tasks a turn
+            await asyncio.sleep(0)
+        self.running = False
+
+    def load(self):
+        # fraction of wall time spent emulating
+        return self.busy * self.hz / max(self.emulated, 1)
+
+    def report(self):
+        return '{} slices, {} missed, {} resyncs, drift {:+.2f} ms (max {:+.2f} ms), load {:.0%}'.format(
+            self.slices, self.missed, self.resyncs, self.drift * 1000, self.max_drift * 1000, self.load())
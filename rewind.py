@@ -0,0 +1,156 @@
+# reverse execution
+# records a run so it can be stepped backwards:
+#   - a full snapshot every `interval` instructions, the last `ring` kept
+#   - a journal of the last `journal` instructions, each entry holding the
+#     registers before the instruction and the (address, old byte) of every
+#     write it made
+# step_back() undoes journal entries directly; going back further restores
+# the nearest snapshot and replays forward with CPU.step(). Replay assumes
+# the devices on the bus behave the same the second time round.
+#
+#   rw = rewind.Rewinder(cpu)
+#   rw.run(cycles=50000000)
+#   rw.step_back()
+#   rw.run_back_to(0x1234)
+
+import collections
+import operator
+
+import emulator
+
+PC = emulator.STATE.index('pc')
+
+
+class Rewinder:
+    def __init__(self, cpu, interval=10000, ring=32, journal=100000):
+        self.cpu = cpu
+        self.interval = interval
+        self.snapshots = collections.deque(maxlen=ring)     # (position, snapshot)
+        self.journal = collections.deque(maxlen=journal)    # (registers, writes)
+        self.position = 0       # instructions executed since recording started
+        self.registers = operator.attrgetter(*emulator.STATE)
+
+        # journal writes by putting a recording write in front of the bus
+        bus = cpu.bus
+        ram = bus.ram
+        bus_write = bus.write
+        self.writes = []
+
+        def write(address, data):
+            self.writes.append((address & 0xFFFF, ram[address & 0xFFFF]))
+            bus_write(address, data)
+
+        self.bus_write = bus_write
+        cpu.write = write
+        self.snapshots.append((0, cpu.snapshot()))
+
+    def detach(self):
+        self.cpu.write = self.bus_write
+
+    def step(self):
+        cpu = self.cpu
+        self.writes = []
+        self.journal.append((self.registers(cpu), self.writes))
+        spent = cpu.step()
+        self.position += 1
+        snapshots = self.snapshots
+        if self.position % self.interval == 0 and not (snapshots and snapshots[-1][0] == self.position):
+            snapshots.append((self.position, cpu.snapshot()))
+        return spent
+
+    def run(self, cycles=None, instructions=None):
+        # CPU.run() with recording; same budget carry-over
+        cpu = self.cpu
+        if cycles is None and instructions is None:
+            raise ValueError('run() needs cycles or instructions')
+        executed = 0
+        budget = cpu.budget + cycles if cycles is not None else 1
+        while not cpu.halt and budget > 0 and (instructions is None or executed < instructions):
+            spent = self.step()
+            if cycles is not None:
+                budget -= spent
+            executed += 1
+        if cycles is not None:
+            cpu.budget = budget
+        return executed
+
+    def undo(self):
+        # through load() so write hooks (code caches, dirty pages) see the
+        # restored bytes
+        registers, writes = self.journal.pop()
+        bus = self.cpu.bus
+        for address, old in reversed(writes):
+            bus.load(address, bytes((old,)))
+        self.set_registers(registers)
+        self.position -= 1
+        self.drop_snapshots()
+
+    def drop_snapshots(self):
+        # snapshots from after the current position belong to a future that
+        # stepping forward again will record afresh
+        while self.snapshots and self.snapshots[-1][0] > self.position:
+            self.snapshots.pop()
+
+    def set_registers(self, registers):
+        cpu = self.cpu
+        for name, value in zip(emulator.STATE, registers):
+            setattr(cpu, name, value)
+        cpu.current_byte = cpu.lookup[cpu.opcode]
+
+    def oldest(self):
+        # earliest instruction that can still be reached
+        oldest = self.position - len(self.journal)
+        if self.snapshots:
+            oldest = min(oldest, self.snapshots[0][0])
+        return oldest
+
+    def step_back(self, count=1):
+        target = self.position - count
+        if target < self.oldest():
+            raise ValueError('instruction {} is older than the recorded history'.format(target))
+        while self.journal and self.position > target:
+            self.undo()
+        if self.position > target:
+            self.goto(target)
+
+    def goto(self, target):
+        # move to instruction target: backwards by restoring the newest
+        # snapshot at or before it, then forwards by replaying
+        if target < self.position:
+            while self.snapshots and self.snapshots[-1][0] > target:
+                self.snapshots.pop()
+            if not self.snapshots:
+                raise ValueError('instruction {} is older than the recorded history'.format(target))
+            position, state = self.snapshots[-1]
+            self.cpu.restore(state)
+            self.position = position
+            self.journal.clear()
+        while self.position < target:
+            self.step()
+
+    def run_back_to(self, pc):
+        # go back to the latest earlier point where the CPU was about to
+        # execute the instruction at pc; returns False if it isn't in history
+        for back, (registers, _) in enumerate(reversed(self.journal), 1):
+            if registers[PC] == pc:
+                self.step_back(back)
+                return True
+
+        # not in the journal: search the older history snapshot by snapshot,
+        # newest first, replaying each stretch to find the last visit
+        end = self.position - len(self.journal)
+        current = self.position
+        starts = [position for position, _ in self.snapshots if position < end]
+        for start in reversed(starts):
+            self.goto(start)
+            found = None
+            while self.position < end:
+                if self.cpu.pc == pc:
+                    found = self.position
+                self.step()
+            if found is not None:
+                self.goto(found)
+                return True
+            end = start
+        self.goto(current)
+        return False
@@ -0,0 +1,110 @@
+# event scheduler
+# keeps timed device events in a heap keyed on cpu.clock_count and runs the
+# CPU in slices of whole instructions from one deadline to the next, so
+# nothing is checked per cycle or per instruction. Events fire at the first
+# instruction boundary at or after their deadline; a periodic event is
+# re-armed from its deadline, not from when it fired, so it doesn't drift.
+#
+# IRQ and NMI are latched: irq()/nmi() mark them pending and they are taken
+# at the boundary where the current slice ends (immediately, when called
+# from an event callback). A pending IRQ waits while the I flag masks it;
+# only then does the scheduler drop to single instructions until the
+# program unmasks it.
+#
+#   sched = scheduler.Scheduler(cpu)
+#   sched.after(114, sched.irq, period=114)    # scanline interrupt
+#   sched.run(29868)                           # one frame
+#
+# any engine with the run(cycles) budget convention can drive the slices:
+#   scheduler.Scheduler(cpu, functools.partial(fastloop.run, cpu))
+#   scheduler.Scheduler(cpu, translator.BlockTranslator(cpu).run)
+# with an idle.IdleDetector, spin loops waiting for the next event are
+# skipped instead of run.
+
+import heapq
+import itertools
+
+
+class Scheduler:
+    def __init__(self, cpu, engine=None, idle=None):
+        self.cpu = cpu
+        self.engine = cpu.run if engine is None else engine
+        self.idle = idle
+        self.events = []        # heap of [deadline, sequence, callback, period]
+        self.sequence = itertools.count()   # keeps same-deadline events in order
+        self.irq_pending = False
+        self.nmi_pending = False
+
+    def at(self, clock, callback, period=0):
+        # call callback() once clock_count reaches clock, then every period
+        # cycles if period is given; returns a handle for cancel()
+        event = [clock, next(self.sequence), callback, period]
+        heapq.heappush(self.events, event)
+        return event
+
+    def after(self, delay, callback, period=0):
+        return self.at(self.cpu.clock_count + delay, callback, period)
+
+    def cancel(self, event):
+        # left in the heap and skipped when it comes up
+        event[2] = None
+
+    def next_deadline(self):
+        events = self.events
+        while events and events[0][2] is None:
+            heapq.heappop(events)
+        return events[0][0] if events else None
+
+    def irq(self):
+        self.irq_pending = True
+
+    def nmi(self):
+        self.nmi_pending = True
+
+    def dispatch(self):
+        # fire the events that are due, then take pending interrupts
+        cpu = self.cpu
+        events = self.events
+        while events and events[0][0] <= cpu.clock_count:
+            event = heapq.heappop(events)
+            callback, period = event[2], event[3]
+            if callback is None:
+                continue
+            if period:
+                event[0] += period
+                event[1] = next(self.sequence)
+                heapq.heappush(events, event)
+            callback()
+
+        if self.nmi_pending:
+            self.nmi_pending = False
+            cpu.nmi()
+        if self.irq_pending and cpu.irq():
+            self.irq_pending = False
+
+    def run(self, cycles):
+        # like CPU.run(cycles=...): runs whole instructions for the cycle
+        # budget, carrying the overshoot in cpu.budget, with events fired on
+        # time along the way. Returns the number of slices run.
+        cpu = self.cpu
+        end = cpu.clock_count + cpu.budget + cycles
+        slices = 0
+        while not cpu.halt:
+            self.dispatch()
+            now = cpu.clock_count
+            if now >= end or cpu.halt:
+                break
+            if self.irq_pending:
+                # masked IRQ: look again after every instruction
+                cpu.step()
+                continue
+            deadline = self.next_deadline()
+            stop = end if deadline is None else min(end, deadline)
+            if self.idle is None:
+                cpu.budget = 0
+                self.engine(stop - now)
+            else:
+                self.idle.run(self.engine, stop)
+            slices += 1
+        cpu.budget = end - cpu.clock_count
+        return slices
@@ -0,0 +1,125 @@
+# shared-memory machine state
+# SharedBus keeps the 64 KiB address space in a multiprocessing.shared_memory
+# segment, behind a small header holding the registers and clock_count, so
+# another process (a dashboard, memory viewer or test oracle) can attach and
+# read the live machine without pausing it or copying anything.
+#
+# RAM is live: every write the CPU makes is visible to a monitor straight
+# away. The header is only as fresh as the last publish(cpu), which the
+# emulating side calls between slices, e.g. once a frame:
+#
+#   bus = shared.SharedBus(name='atari')
+#   cpu = emulator.CPU(bus)
+#   sched.after(29868, lambda: bus.publish(cpu), period=29868)
+#
+# and in the other process:
+#
+#   monitor = shared.attach('atari')
+#   monitor.state()         # {'a': .., 'pc': .., 'clock_count': .., ...}
+#   monitor.ram[0x0600]
+#
+# the header carries a sequence number that is odd while publish() is
+# writing it, so state() never returns a half-updated set of registers.
+
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from emulator import Bus
+
+# magic, version, sequence; then a, x, y, sp, pc, p, clock_count
+HEADER = struct.Struct('<4sHxxQ')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 8
+STATE = struct.Struct('<6HQ')
+HEADER_SIZE = 64
+MAGIC = b'6502'
+VERSION = 1
+REGISTERS = ('a', 'x', 'y', 'sp', 'pc', 'p')
+
+
+class SharedBus(Bus):
+    def __init__(self, name=None):
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + Bus.SIZE)
+        self.name = self.shm.name
+        self.header = self.shm.buf[:HEADER_SIZE]
+        self.sequence = 0
+        super().__init__(self.shm.buf[HEADER_SIZE:HEADER_SIZE + Bus.SIZE])
+        self.publish_state((0,) * len(REGISTERS), 0)
+
+    def publish(self, cpu):
+        self.publish_state([getattr(cpu, name) for name in REGISTERS], cpu.clock_count)
+
+    def publish_state(self, registers, clock_count):
+        # odd sequence while writing, even again once done
+        self.sequence += 1
+        HEADER.pack_into(self.header, 0, MAGIC, VERSION, self.sequence)
+        STATE.pack_into(self.header, HEADER.size, *[value & 0xFFFF for value in registers], clock_count)
+        self.sequence += 1
+        SEQUENCE.pack_into(self.header, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        # release our views and the segment; the creator also unlinks it
+        self.header.release()
+        self.memory.release()
+        self.ram.release()
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Monitor:
+    # read-only view of a SharedBus from another process
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name=name)
+        # the creator owns the segment; keep this process's resource tracker
+        # from unlinking it when we exit
+        try:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception:
+            pass
+        self.header = self.shm.buf[:HEADER_SIZE]
+        self.ram = self.shm.buf[HEADER_SIZE:HEADER_SIZE + Bus.SIZE].toreadonly()
+        magic, version = HEADER.unpack_from(self.header)[:2]
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not a version {} shared bus'.format(name, VERSION))
+
+    def state(self, retries=10000):
+        # registers and clock_count as of the last publish(); yields the CPU
+        # between retries while a publish() is in progress, and gives up
+        # if the writer never finishes (e.g. it died mid-update)
+        header = self.header
+        for _ in range(retries):
+            sequence = SEQUENCE.unpack_from(header, SEQUENCE_OFFSET)[0]
+            fields = STATE.unpack_from(header, HEADER.size)
+            if sequence & 1 or SEQUENCE.unpack_from(header, SEQUENCE_OFFSET)[0] != sequence:
+                time.sleep(0)
+                continue
+            state = dict(zip(REGISTERS, fields))
+            state['clock_count'] = fields[6]
+            return state
+        raise TimeoutError('{} stayed mid-publish for {} reads'.format(self.shm.name, retries))
+
+    def read(self, address, length=1):
+        return bytes(self.ram[address:address + length])
+
+    def close(self):
+        self.ram.release()
+        self.header.release()
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(name):
+    return Monitor(name)
@@ -1,38 +1,65 @@
 # flag byte used for status register
-# bit flags are stored as bools
+# the flags are packed into a single int, one bit per flag
 # can set_byte() to set the individual bits
 # get_byte() returns single byte word
 
+C = 0b00000001
+Z = 0b00000010
+I = 0b00000100
+D = 0b00001000
+B = 0b00010000
+U = 0b00100000
+V = 0b01000000
+N = 0b10000000
+
+# N and Z for every 8-bit result, so a load or ALU op updates both
+# flags with one table lookup: p = (p & ~(N | Z)) | NZ[result]
+NZ = bytes((value & N) | (0 if value else Z) for value in range(256))
+
+
+def _bit(mask):
+    def get(self):
+        return bool(self.byte & mask)
+
+    def set(self, value):
+        if value:
+            self.byte |= mask
+        else:
+            self.byte &= ~mask
+
+    return property(get, set)
+
 
 class Flag:
-    def __init__(self):
-        self.C = False  # 0b00000001
-        self.Z = False  # 0b00000010
-        self.I = False  # 0b00000100
-        self.D = False  # 0b00001000
-        self.B = False  # 0b00010000
-        self.U = False  # 0b00100000
-        self.V = False  # 0b01000000
-        self.N = False  # 0b10000000
+    C = _bit(C)
+    Z = _bit(Z)
+    I = _bit(I)
+    D = _bit(D)
+    B = _bit(B)
+    U = _bit(U)
+    V = _bit(V)
+    N = _bit(N)
+
+    def __init__(self, byte=0):
+        self.byte = byte
 
     def set_byte(self, byte):
-        self.C = bool(byte & 0b00000001)
-        self.Z = bool(byte & 0b00000010)
-        self.I = bool(byte & 0b00000100)
-        self.D = bool(byte & 0b00001000)
-        self.B = bool(byte & 0b00010000)
-        self.U = bool(byte & 0b00100000)
-        self.V = bool(byte & 0b01000000)
-        self.N = bool(byte & 0b10000000)
+        self.byte = byte & 0xFF
 
     def get_byte(self):
-        byte = int(self.C << 0)
-        byte += int(self.Z << 1)
-        byte += int(self.I << 2)
-        byte += int(self.D << 3)
-        byte += int(self.B << 4)
-        byte += int(self.U << 5)
-        byte += int(self.V << 6)
-        byte += int(self.N << 7)
-        return byte
+        return self.byte
+
+
+class RegisterFlag(Flag):
+    # Flag interface onto the packed p register of a CPU, for callers
+    # that still use status.C / status.get_byte()
+    def __init__(self, owner):
+        self.owner = owner
+
+    @property
+    def byte(self):
+        return self.owner.p
 
+    @byte.setter
+    def byte(self, value):
+        self.owner.p = value
@@ -0,0 +1,45 @@
+import numpy as np
+
+import batch
+import emulator as emu
+
+
+def machine(code):
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes(code))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    return cpu
+
+
+def registers(cpu):
+    return (cpu.a, cpu.x, cpu.y, cpu.sp, cpu.pc, cpu.p, cpu.clock_count)
+
+
+def check_lanes(code, cycles=2000):
+    # every lane must end where a scalar CPU with the same RAM ends up
+    cpu = machine(code)
+    lanes = batch.Batch.from_cpu(cpu, 8)
+    lanes.ram[:, 0x80] = np.arange(8) * 37
+    lanes.run(cycles=cycles)
+    for index in range(8):
+        scalar = machine(code)
+        scalar.bus.ram[0x80] = index * 37 & 0xFF
+        scalar.run(cycles=cycles)
+        assert registers(lanes.lane(index)) == registers(scalar), index
+
+
+def test_lanes_match_scalar_arithmetic():
+    # LDA $80 / CLC / ADC #$05 / EOR #$5A / INX / JMP $0200
+    check_lanes([0xA5, 0x80, 0x18, 0x69, 0x05, 0x49, 0x5A, 0xE8, 0x4C, 0x00, 0x02])
+
+
+def test_lanes_match_scalar_divergent_branches():
+    # LDA $80 / AND #$01 / BEQ +1 / INX / INY / JMP $0200
+    check_lanes([0xA5, 0x80, 0x29, 0x01, 0xF0, 0x01, 0xE8, 0xC8, 0x4C, 0x00, 0x02])
+
+
+def test_instructions_limit():
+    lanes = batch.Batch.from_cpu(machine([0xE8, 0x4C, 0x00, 0x02]), 3)     # INX / JMP $0200
+    assert lanes.run(instructions=5) == 5
+    assert list(lanes.x) == [3, 3, 3]
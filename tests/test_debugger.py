@@ -0,0 +1,48 @@
+import emulator as emu
+import debugger
+
+
+def machine():
+    # LDA $10 / STA $11 / JMP $0200
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes([0xA5, 0x10, 0x85, 0x11, 0x4C, 0x00, 0x02]))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    return cpu
+
+
+def test_watch_stops_run():
+    cpu = machine()
+    dbg = debugger.Debugger(cpu)
+    dbg.add_watchpoint(0x10, read=True, write=False)
+    assert dbg.run(cycles=1000) == ('read', 0x10, 0)
+    dbg.remove_watchpoint(0x10)
+    dbg.add_watchpoint(0x11)
+    assert dbg.run(cycles=1000) == ('write', 0x11, 0)
+
+
+def test_hits_not_recorded_outside_run():
+    cpu = machine()
+    dbg = debugger.Debugger(cpu)
+    dbg.add_watchpoint(0x10, read=True)
+    dbg.add_watchpoint(0x11)
+    cpu.run(cycles=20000)
+    assert dbg.hits == []
+    assert dbg.run(cycles=1000)[0] in ('read', 'write')
+
+
+def test_read_watch_over_code_ignores_fetches():
+    # NOP / LDA $0200 / JMP $0200: only LDA's data read of the NOP byte counts
+    cpu = machine()
+    cpu.bus.load(0x0200, bytes([0xEA, 0xAD, 0x00, 0x02, 0x4C, 0x00, 0x02]))
+    dbg = debugger.Debugger(cpu)
+    dbg.add_watchpoint(0x0200, 0x0206, read=True, write=False)
+    assert dbg.run(cycles=1000) == ('read', 0x0200, 0xEA)
+    assert cpu.pc == 0x0204
+
+
+def test_read_watch_over_code_without_data_reads():
+    cpu = machine()
+    dbg = debugger.Debugger(cpu)
+    dbg.add_watchpoint(0x0200, 0x0206, read=True, write=False)
+    assert dbg.run(cycles=1000) is None
@@ -0,0 +1,46 @@
+import emulator as emu
+
+
+def machine():
+    # LDA #$01 / STA $10 / JMP $0200
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes([0xA9, 0x01, 0x85, 0x10, 0x4C, 0x00, 0x02]))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    cpu.bus.track_writes()
+    return cpu
+
+
+def test_state_hash_ignores_scratch_and_clock():
+    early = machine()
+    late = machine()
+    early.run(instructions=3)
+    late.run(instructions=6)
+    assert early.clock_count != late.clock_count
+    assert early.state_hash() == late.state_hash()
+
+
+def test_state_hash_sees_registers_and_memory():
+    cpu = machine()
+    cpu.run(instructions=3)
+    before = cpu.state_hash()
+    cpu.x = 1
+    assert cpu.state_hash() != before
+    cpu.x = 0
+    cpu.bus.write(0x10, 2)
+    assert cpu.state_hash() != before
+
+
+def test_state_hash_without_track_writes():
+    cpu = emu.CPU()
+    other = emu.CPU()
+    assert cpu.state_hash() == other.state_hash()
+    cpu.bus.write(0x1234, 1)
+    assert cpu.state_hash() != other.state_hash()
+
+
+def test_state_hash_masks_pc():
+    cpu = machine()
+    other = machine()
+    other.pc += 0x10000
+    assert cpu.state_hash() == other.state_hash()
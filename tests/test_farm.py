@@ -0,0 +1,67 @@
+import json
+
+import farm
+
+# LDX #$03 / DEX / BNE back to DEX / BRK
+COUNTDOWN = bytes([0xA2, 0x03, 0xCA, 0xD0, 0xFD, 0x00, 0x00])
+# INX / JMP $0200
+SPIN = bytes([0xE8, 0x4C, 0x00, 0x02])
+
+
+def rom(tmp_path, code, name='rom.bin'):
+    # raw image at $0000 with the reset vector pointing at $0200
+    image = bytearray(0x10000)
+    image[0x0200:0x0200 + len(code)] = code
+    image[0xFFFC:0xFFFE] = b'\x00\x02'
+    path = tmp_path / name
+    path.write_bytes(bytes(image))
+    return str(path)
+
+
+def test_number():
+    assert farm.number(4660) == farm.number('4660') == farm.number('$1234') == farm.number('0x1234')
+
+
+def test_run_until_brk(tmp_path):
+    result = farm.run_job({'name': 'countdown', 'rom': rom(tmp_path, COUNTDOWN)})
+    assert result['name'] == 'countdown'
+    assert result['stopped'] == 'brk'
+    assert result['registers']['x'] == 0
+
+
+def test_stop_at_pc(tmp_path):
+    result = farm.run_job({'rom': rom(tmp_path, COUNTDOWN), 'stop': {'pc': '$0205'}})
+    assert result['stopped'] == 'pc'
+    assert result['registers']['pc'] == 0x0205
+
+
+def test_memory_and_registers(tmp_path):
+    result = farm.run_job({'rom': rom(tmp_path, SPIN), 'memory': {'$0080': '01ff'},
+                           'registers': {'x': '$10'}, 'cycles': 100})
+    assert result['stopped'] == 'cycles'
+    assert result['registers']['x'] > 0x10
+
+
+def test_engines_agree(tmp_path):
+    path = rom(tmp_path, SPIN)
+    results = [farm.run_job({'rom': path, 'cycles': 5000, 'engine': engine})
+               for engine in ('interpreter', 'fastloop')]
+    assert results[0]['registers'] == results[1]['registers']
+    assert results[0]['memory_sha1'] == results[1]['memory_sha1']
+
+
+def test_errors_are_reported():
+    result = farm.safe_run_job({'name': 'bad', 'registers': {'q': 1}})
+    assert result['name'] == 'bad' and 'unknown register' in result['error']
+
+
+def test_manifest_through_the_pool(tmp_path):
+    rom(tmp_path, COUNTDOWN, 'countdown.bin')
+    manifest = tmp_path / 'jobs.json'
+    manifest.write_text(json.dumps({'jobs': [
+        {'name': 'one', 'rom': 'countdown.bin'},
+        {'name': 'two', 'rom': 'countdown.bin', 'registers': {'q': 0}},
+    ]}))
+    results = {result['name']: result for result in farm.run_jobs(farm.load_manifest(str(manifest)), 2)}
+    assert results['one']['stopped'] == 'brk'
+    assert 'error' in results['two']
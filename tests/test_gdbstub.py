@@ -0,0 +1,98 @@
+import socket
+import threading
+
+import emulator as emu
+import gdbstub
+
+
+def server():
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes([0xE8, 0x4C, 0x00, 0x02]))     # INX / JMP $0200
+    cpu.pc = 0x0200
+    return gdbstub.GDBServer(cpu, chunk=1000)
+
+
+def test_registers_and_memory():
+    stub = server()
+    assert stub.handle(b'P0=42') == 'OK'
+    assert stub.handle(b'p0') == '42'
+    assert stub.handle(b'p5') == '0002'
+    assert stub.handle(b'M300,2:aabb') == 'OK'
+    assert stub.handle(b'm300,2') == 'aabb'
+    assert stub.handle(gdbstub.unescape(b'X302,1:}]')) == 'OK'     # escaped '}'
+    assert stub.handle(b'm302,1') == '7d'
+
+
+def test_empty_packet():
+    assert server().handle(b'') == ''
+
+
+def test_malformed_packets():
+    stub = server()
+    for packet in (b'pzz', b'P0', b'P0=zz', b'P0=4242', b'mzz,1', b'm300', b'Mzz,1:00',
+                   b'M300,1:zz', b'M300,1', b'X300', b'Zq,300,1', b'Z0,300', b'Gzz', b'G00',
+                   b'czz', b'szz'):
+        assert stub.handle(packet) == 'E01', packet
+
+
+def test_out_of_range():
+    stub = server()
+    assert stub.handle(b'm10000,1').startswith('E')
+    assert stub.handle(b'mffff,4') == '00'
+    assert stub.handle(b'Mffff,2:0000').startswith('E')
+    assert stub.handle(b'p6') == 'E00'
+    assert stub.handle(b'c10000').startswith('E')
+    assert stub.handle(b'Z2,ffff,2').startswith('E')
+
+
+def test_breakpoint_continue_over_socket():
+    stub = server()
+    listener = socket.create_server(('127.0.0.1', 0))
+    thread = threading.Thread(target=stub.serve, args=(listener,))
+    thread.start()
+    received = b''
+
+    def command(payload):
+        nonlocal received
+        client.sendall(b'$' + payload + b'#%02x' % (sum(payload) & 0xFF))
+        while True:
+            received = received.lstrip(b'+')
+            end = received.find(b'#')
+            if end >= 0 and len(received) >= end + 3:
+                reply, received = received[1:end], received[end + 3:]
+                client.sendall(b'+')
+                return reply
+            received += client.recv(4096)
+
+    with socket.create_connection(listener.getsockname(), timeout=5) as client:
+        assert command(b'') == b''
+        assert command(b'Z0,201,1') == b'OK'
+        assert command(b'c') == b'S05'
+        assert command(b'p5') == b'0102'
+        assert command(b's') == b'S05'
+        assert command(b'p5') == b'0002'
+        assert command(b'D') == b'OK'
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_bad_checksum_is_nacked():
+    stub = server()
+    listener = socket.create_server(('127.0.0.1', 0))
+    thread = threading.Thread(target=stub.serve, args=(listener,))
+    thread.start()
+    with socket.create_connection(listener.getsockname(), timeout=5) as client:
+        client.sendall(b'$g#zz')
+        assert client.recv(1) == b'-'
+        client.sendall(b'$g#67')
+        received = b''
+        while b'#' not in received[:-2]:
+            received += client.recv(4096)
+        assert received == b'+$00000000000002#a2'     # a, x, y, sp, p, pc = $0200
+        client.sendall(b'+$D#44')
+        received = b''
+        while b'#' not in received[:-2]:
+            received += client.recv(4096)
+        assert received == b'+$OK#9a'
+    thread.join(5)
+    assert not thread.is_alive()
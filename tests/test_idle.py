@@ -0,0 +1,43 @@
+import emulator as emu
+import idle
+
+
+def machine(code):
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes(code))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    cpu.step()
+    return cpu
+
+
+SPIN = [0xA5, 0x10, 0xF0, 0xFC]     # LDA $10 / BEQ back to it
+
+
+def test_probe_finds_spin_loop():
+    cpu = machine(SPIN)
+    assert idle.IdleDetector(cpu).probe(10000) > 0
+
+
+def test_probe_rejects_busy_loop():
+    cpu = machine([0xE8, 0x4C, 0x00, 0x02])     # INX / JMP $0200
+    assert idle.IdleDetector(cpu).probe(10000) == 0
+
+
+def test_probe_keeps_an_existing_read_wrapper():
+    cpu = machine(SPIN)
+    bus = cpu.bus
+    reads = []
+    bus_read = bus.read
+
+    def counting(address):
+        reads.append(address)
+        return bus_read(address)
+
+    bus.read = counting
+    detector = idle.IdleDetector(cpu)
+    assert detector.probe(10000)
+    assert bus.read is counting and reads
+    assert detector.probe(10000)
+    assert bus.read is counting
+
@@ -0,0 +1,91 @@
+import emulator as emu
+from status_reg import B, I, Z, N
+
+
+def machine(code, origin=0x0200):
+    cpu = emu.CPU()
+    cpu.bus.load(origin, bytes(code))
+    cpu.bus.load(0xFFFC, origin.to_bytes(2, 'little'))
+    cpu.reset()
+    return cpu
+
+
+def steps(cpu, count):
+    for _ in range(count):
+        cpu.step()
+
+
+def test_stores():
+    # LDA #$11 / LDX #$22 / LDY #$33 / STA $10 / STX $11 / STY $12
+    cpu = machine([0xA9, 0x11, 0xA2, 0x22, 0xA0, 0x33, 0x85, 0x10, 0x86, 0x11, 0x84, 0x12])
+    steps(cpu, 6)
+    assert cpu.bus.dump(0x10, 3) == b'\x11\x22\x33'
+
+
+def test_transfers_set_flags():
+    # LDA #$80 / TAX / TAY / LDA #$00 / TXA
+    cpu = machine([0xA9, 0x80, 0xAA, 0xA8, 0xA9, 0x00, 0x8A])
+    steps(cpu, 3)
+    assert (cpu.x, cpu.y) == (0x80, 0x80)
+    assert cpu.p & N
+    steps(cpu, 1)
+    assert cpu.p & Z
+    steps(cpu, 1)
+    assert cpu.a == 0x80 and cpu.p & N and not cpu.p & Z
+
+
+def test_stack_pointer_transfers():
+    # LDX #$40 / TXS / TSX / TYA
+    cpu = machine([0xA2, 0x40, 0x9A, 0xBA, 0x98])
+    steps(cpu, 4)
+    assert cpu.sp == 0x40 and cpu.x == 0x40
+    assert cpu.a == 0 and cpu.p & Z
+
+
+def test_push_pull():
+    # LDA #$5A / PHA / LDA #$00 / PLA
+    cpu = machine([0xA9, 0x5A, 0x48, 0xA9, 0x00, 0x68])
+    steps(cpu, 2)
+    assert cpu.sp == 0xFC and cpu.bus.ram[0x01FD] == 0x5A
+    steps(cpu, 2)
+    assert cpu.a == 0x5A and cpu.sp == 0xFD and not cpu.p & (Z | N)
+
+
+def test_ora():
+    # LDA #$0F / ORA #$F0
+    cpu = machine([0xA9, 0x0F, 0x09, 0xF0])
+    steps(cpu, 2)
+    assert cpu.a == 0xFF and cpu.p & N
+
+
+def test_jsr_rts_round_trip():
+    # $0200 JSR $0210 / $0203 LDA #$01; $0210 RTS
+    cpu = machine([0x20, 0x10, 0x02, 0xA9, 0x01] + [0] * 11 + [0x60])
+    steps(cpu, 1)
+    assert cpu.pc == 0x0210
+    assert cpu.bus.dump(0x01FC, 2) == b'\x02\x02'   # return address - 1
+    steps(cpu, 1)
+    assert cpu.pc == 0x0203 and cpu.sp == 0xFD
+
+
+def test_stack_pointer_wraps():
+    # LDX #$00 / TXS / PHA / PLA
+    cpu = machine([0xA2, 0x00, 0x9A, 0x48, 0x68])
+    steps(cpu, 3)
+    assert cpu.sp == 0xFF
+    steps(cpu, 1)
+    assert cpu.sp == 0x00
+
+
+def test_brk_rti_round_trip():
+    # $0200 BRK #$EA / $0202 LDA #$01; handler at $0300 is RTI
+    cpu = machine([0x00, 0xEA, 0xA9, 0x01])
+    cpu.bus.load(0x0300, b'\x40')
+    cpu.bus.load(0xFFFE, b'\x00\x03')
+    steps(cpu, 1)
+    assert cpu.pc == 0x0300 and cpu.p & I
+    assert cpu.bus.dump(0x01FC, 2) == b'\x02\x02'   # return address $0202
+    assert cpu.bus.ram[0x01FB] & B
+    cpu.halt = False
+    steps(cpu, 1)
+    assert cpu.pc == 0x0202 and cpu.sp == 0xFD
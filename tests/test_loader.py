@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+import emulator as emu
+import farm
+import loader
+
+
+def hex_record(kind, offset, payload):
+    record = bytes([len(payload), offset >> 8, offset & 0xFF, kind]) + bytes(payload)
+    return ':' + (record + bytes([-sum(record) & 0xFF])).hex().upper()
+
+
+def hex_file(*records):
+    return ('\n'.join(records + (hex_record(0x01, 0, b''),)) + '\n').encode()
+
+
+def xex_file(*segments):
+    data = b'\xff\xff'
+    for start, payload in segments:
+        data += start.to_bytes(2, 'little') + (start + len(payload) - 1).to_bytes(2, 'little') + payload
+    return data
+
+
+def test_raw():
+    image = loader.parse_raw(b'\x01\x02\x03', 0xC000)
+    assert image.segments == [(0xC000, b'\x01\x02\x03')] and image.run is None
+    with pytest.raises(ValueError):
+        loader.parse_raw(b'\x00' * 4, 0xFFFE)
+
+
+def test_hex_merges_adjacent_records_and_reads_start():
+    data = hex_file(hex_record(0x00, 0x0200, b'\xA9\x01'),
+                    hex_record(0x00, 0x0202, b'\xE8'),
+                    hex_record(0x00, 0x0400, b'\x55'),
+                    hex_record(0x05, 0, (0x0200).to_bytes(4, 'big')))
+    image = loader.parse_hex(data)
+    assert image.segments == [(0x0200, b'\xA9\x01\xE8'), (0x0400, b'\x55')]
+    assert image.run == 0x0200
+
+
+def test_hex_rejects_bad_checksum():
+    line = hex_record(0x00, 0x0200, b'\xA9\x01')
+    with pytest.raises(ValueError, match='checksum'):
+        loader.parse_hex((line[:-2] + '00\n').encode())
+
+
+def test_xex_run_and_init_addresses():
+    data = xex_file((0x0600, b'\x60'),
+                    (loader.INITAD, b'\x00\x06'),
+                    (0x2000, b'\xE8\xE8'),
+                    (loader.RUNAD, b'\x00\x20'))
+    image = loader.parse_xex(data)
+    assert image.run == 0x2000 and image.inits == [0x0600]
+    assert (0x2000, b'\xE8\xE8') in image.segments
+    with pytest.raises(ValueError):
+        loader.parse_xex(b'\x00\x06\x00\x06\x60')
+
+
+def test_detect():
+    assert loader.detect('a.hex', b'') == 'hex'
+    assert loader.detect('a.xex', b'') == 'xex'
+    assert loader.detect('a.bin', b'\xff\xff') == 'raw'
+    assert loader.detect('a', b'\xff\xff\x00') == 'xex'
+    assert loader.detect('a', b':10') == 'hex'
+    assert loader.detect('a', b'\xA9') == 'raw'
+
+
+def test_load_file_sets_reset_vector_and_caches(tmp_path):
+    path = tmp_path / 'game.xex'
+    path.write_bytes(xex_file((0x2000, b'\xE8\xE8'), (loader.RUNAD, b'\x00\x20')))
+    cpu = emu.CPU()
+    image = loader.load_file(cpu, str(path))
+    cpu.reset()
+    assert cpu.pc == 0x2000 and cpu.bus.dump(0x2000, 2) == b'\xE8\xE8'
+    assert loader.read_image(str(path)) is image
+
+    path.write_bytes(xex_file((0x3000, b'\xEA'), (loader.RUNAD, b'\x00\x30')))
+    os.utime(path, ns=(0, 1))
+    assert loader.read_image(str(path)).run == 0x3000
+
+
+def test_farm_loads_hex(tmp_path):
+    path = tmp_path / 'job.hex'
+    path.write_bytes(hex_file(hex_record(0x00, 0x0200, b'\xA2\x05\x00\x00'),     # LDX #5 / BRK
+                              hex_record(0x05, 0, (0x0200).to_bytes(4, 'big'))))
+    result = farm.run_job({'rom': str(path)})
+    assert result['stopped'] == 'brk' and result['registers']['x'] == 5
@@ -0,0 +1,42 @@
+import emulator as emu
+import rewind
+
+
+def machine():
+    # INX / STX $10 / JMP $0200
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes([0xE8, 0x86, 0x10, 0x4C, 0x00, 0x02]))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    return cpu
+
+
+def test_back_forward_back_keeps_history():
+    cpu = machine()
+    rw = rewind.Rewinder(cpu, interval=100, ring=8, journal=50)
+    rw.run(instructions=600)
+    for _ in range(6):
+        rw.step_back(30)
+        rw.run(instructions=30)
+    positions = [position for position, _ in rw.snapshots]
+    assert positions == sorted(set(positions))
+    assert positions[-1] == 600
+
+    rw.step_back(200)
+    assert rw.position == 400
+    reference = machine()
+    for _ in range(400):
+        reference.step()
+    assert (cpu.pc, cpu.x, cpu.bus.ram[0x10]) == (reference.pc, reference.x, reference.bus.ram[0x10])
+
+
+def test_undo_goes_through_write_hooks():
+    cpu = machine()
+    cpu.bus.track_writes()
+    rw = rewind.Rewinder(cpu)
+    rw.run(instructions=10)
+    cpu.bus.memory_hash()
+    rw.step_back(3)
+    incremental = cpu.bus.memory_hash()
+    cpu.bus.track_writes()
+    assert incremental == cpu.bus.memory_hash()
@@ -0,0 +1,96 @@
+import functools
+
+import emulator as emu
+import fastloop
+import scheduler
+
+
+def machine(code, handler=(0x40,)):
+    # code at $0200; IRQ and NMI handlers at $0300 (RTI by default)
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes(code))
+    cpu.bus.load(0x0300, bytes(handler))
+    cpu.bus.load(0xFFFA, b'\x00\x03\x00\x02\x00\x03')
+    cpu.reset()
+    return cpu
+
+
+SPIN = [0x58, 0xE8, 0x4C, 0x01, 0x02]     # CLI / INX / JMP $0201
+COUNT_IRQS = [0xC8, 0x40]                   # INY / RTI
+
+
+def test_events_fire_in_order_at_their_deadline():
+    cpu = machine(SPIN)
+    sched = scheduler.Scheduler(cpu)
+    fired = []
+    sched.at(100, lambda: fired.append(('b', cpu.clock_count)))
+    sched.at(50, lambda: fired.append(('a', cpu.clock_count)))
+    sched.at(100, lambda: fired.append(('c', cpu.clock_count)))
+    sched.run(1000)
+    assert [name for name, _ in fired] == ['a', 'b', 'c']
+    assert 50 <= fired[0][1] < 50 + 7
+    assert 100 <= fired[1][1] == fired[2][1] < 100 + 7
+
+
+def test_periodic_events_do_not_drift():
+    cpu = machine(SPIN)
+    sched = scheduler.Scheduler(cpu)
+    fired = []
+    sched.at(100, lambda: fired.append(cpu.clock_count), period=100)
+    sched.run(10050)
+    assert len(fired) == 100
+    for count, clock in enumerate(fired, 1):
+        assert count * 100 <= clock < count * 100 + 7
+
+
+def test_cancel():
+    cpu = machine(SPIN)
+    sched = scheduler.Scheduler(cpu)
+    fired = []
+    event = sched.after(100, lambda: fired.append(1))
+    sched.cancel(event)
+    sched.run(1000)
+    assert fired == [] and sched.next_deadline() is None
+
+
+def test_budget_carries_over():
+    cpu = machine(SPIN)
+    sched = scheduler.Scheduler(cpu)
+    sched.run(1000)
+    assert cpu.clock_count + cpu.budget == 1000
+
+
+def test_irq_runs_handler():
+    cpu = machine(SPIN, COUNT_IRQS)
+    sched = scheduler.Scheduler(cpu)
+    sched.after(100, sched.irq, period=100)
+    sched.run(1050)
+    assert cpu.y == 10
+
+
+def test_masked_irq_waits():
+    cpu = machine([0x78, 0xE8, 0x4C, 0x01, 0x02], COUNT_IRQS)   # SEI / INX / JMP $0201
+    sched = scheduler.Scheduler(cpu)
+    sched.after(100, sched.irq)
+    sched.run(1000)
+    assert cpu.y == 0 and sched.irq_pending
+
+
+def test_nmi_ignores_i_flag():
+    cpu = machine([0x78, 0xE8, 0x4C, 0x01, 0x02], COUNT_IRQS)
+    sched = scheduler.Scheduler(cpu)
+    sched.after(100, sched.nmi, period=100)
+    sched.run(1050)
+    assert cpu.y == 10
+
+
+def test_fastloop_engine_matches_interpreter():
+    results = []
+    for engine in (None, 'fastloop'):
+        cpu = machine(SPIN, COUNT_IRQS)
+        run = None if engine is None else functools.partial(fastloop.run, cpu)
+        sched = scheduler.Scheduler(cpu, run)
+        sched.after(77, sched.irq, period=77)
+        sched.run(5000)
+        results.append((cpu.a, cpu.x, cpu.y, cpu.sp, cpu.pc, cpu.p, cpu.clock_count, bytes(cpu.bus.ram)))
+    assert results[0] == results[1]
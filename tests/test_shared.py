@@ -0,0 +1,25 @@
+import pytest
+
+import emulator as emu
+import shared
+
+
+def test_monitor_sees_ram_and_published_state():
+    with shared.SharedBus() as bus:
+        cpu = emu.CPU(bus)
+        cpu.a, cpu.pc = 0x12, 0x3456
+        bus.write(0x0600, 0x99)
+        bus.publish(cpu)
+        with shared.attach(bus.name) as monitor:
+            assert monitor.read(0x0600) == b'\x99'
+            state = monitor.state()
+            assert state['a'] == 0x12 and state['pc'] == 0x3456
+
+
+def test_state_gives_up_on_an_unfinished_publish():
+    with shared.SharedBus() as bus:
+        # a writer that died after marking the header busy
+        shared.SEQUENCE.pack_into(bus.header, shared.SEQUENCE_OFFSET, bus.sequence + 1)
+        with shared.attach(bus.name) as monitor:
+            with pytest.raises(TimeoutError):
+                monitor.state(retries=100)
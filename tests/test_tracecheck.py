@@ -0,0 +1,47 @@
+import emulator as emu
+import tracecheck
+
+
+def machine(code):
+    cpu = emu.CPU()
+    cpu.bus.load(0x0200, bytes(code))
+    cpu.bus.load(0xFFFC, b'\x00\x02')
+    cpu.reset()
+    return cpu
+
+
+def reference(code, count):
+    cpu = machine(code)
+    records = []
+    for _ in range(count):
+        records.append(tracecheck.cpu_record(cpu, 0))
+        cpu.step()
+    return records
+
+
+LONG = [0xA9, 0x01, 0xA2, 0x02, 0xA0, 0x03, 0xE8, 0xC8]    # LDA #1 / LDX #2 / LDY #3 / INX / INY
+
+
+def test_matching_trace():
+    assert tracecheck.check(machine(LONG), reference(LONG, 5)) is None
+
+
+def test_divergence():
+    code = list(LONG)
+    code[3] = 0x05      # LDX #5
+    divergence = tracecheck.check(machine(code), reference(LONG, 5))
+    assert divergence.index == 2 and divergence.fields() == ['x']
+
+
+def test_halt_with_reference_left():
+    # the reference keeps going past the BRK that halts the emulator
+    short = LONG[:4] + [0x00, 0x00]
+    divergence = tracecheck.check(machine(short), reference(short, 5))
+    assert divergence is not None and divergence.halted
+    assert divergence.index == 3
+    assert 'halted' in divergence.report()
+
+
+def test_halt_within_limit():
+    short = LONG[:4] + [0x00, 0x00]
+    assert tracecheck.check(machine(short), reference(short, 5), limit=3) is None
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import translator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import suite    # noqa: E402
+
+
+def state(cpu):
+    return (cpu.a, cpu.x, cpu.y, cpu.sp, cpu.pc, cpu.p, cpu.clock_count, cpu.budget, bytes(cpu.bus.ram))
+
+
+def test_run_stops_at_the_budget_like_the_interpreter():
+    for build in suite.WORKLOADS.values():
+        reference = build()
+        cpu = build()
+        blocks = translator.BlockTranslator(cpu)
+        for cycles in (1, 5, 17, 40, 100, 333, 1000):
+            reference.run(cycles=cycles)
+            blocks.run(cycles)
+            assert state(cpu) == state(reference)
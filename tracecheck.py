@@ -0,0 +1,213 @@
+# differential trace checker
+# steps a CPU alongside a known-good trace and compares pc, opcode, a, x, y,
+# sp, p and the cycle count before every instruction, stopping at the first
+# difference with the instructions around it. References are either
+# nestest-style text logs:
+#
+#   C000  4C F5 C5  JMP $C5F5        A:00 X:00 Y:00 P:24 SP:FD PPU:  0, 21 CYC:7
+#
+# or the compact binary records written by Tracer.drain() (tracer.RECORD).
+# Both are read from an mmap, a record at a time, so a reference of any size
+# is never loaded whole. Cycle counts are compared relative to the first
+# record, so a trace taken after a 7-cycle reset still lines up.
+#
+#   python tracecheck.py nestest.log --load nestest.bin:$C000 --pc $C000
+#   python tracecheck.py record good.trace --load game.xex --instructions 1000000
+#   python tracecheck.py good.trace --load game.xex --engine fastloop
+
+import argparse
+import collections
+import mmap
+import re
+import sys
+
+import emulator as emu
+import loader
+import tracer
+from farm import number
+
+FIELDS = ('pc', 'opcode', 'a', 'x', 'y', 'sp', 'p', 'cycles')
+
+NESTEST_LINE = re.compile(
+    rb'^([0-9A-Fa-f]{4})\s+([0-9A-Fa-f]{2}).*?A:([0-9A-Fa-f]{2}) X:([0-9A-Fa-f]{2}) '
+    rb'Y:([0-9A-Fa-f]{2}) P:([0-9A-Fa-f]{2}) SP:([0-9A-Fa-f]{2}).*?CYC:\s*(\d+)')
+
+
+class Mapped:
+    # a read-only mmap of a file, usable as a context manager
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # empty file
+            self.map = b''
+
+    def __enter__(self):
+        return self.map
+
+    def __exit__(self, *exc):
+        if not isinstance(self.map, bytes):
+            self.map.close()
+        self.file.close()
+
+
+def text_records(path):
+    # (pc, opcode, a, x, y, sp, p, cycles) per nestest-style log line
+    with Mapped(path) as data:
+        for line_number, line in enumerate(iter(data.readline, b'') if data else (), 1):
+            if not line.strip():
+                continue
+            match = NESTEST_LINE.match(line)
+            if match is None:
+                raise ValueError('line {}: not a trace line: {!r}'.format(line_number, line[:60]))
+            pc, opcode, a, x, y, p, sp = [int(value, 16) for value in match.groups()[:7]]
+            yield pc, opcode, a, x, y, sp, p, int(match.group(8))
+
+
+def binary_records(path):
+    record = tracer.RECORD
+    with Mapped(path) as data:
+        if len(data) % record.size:
+            raise ValueError('{} is not a whole number of {}-byte records'.format(path, record.size))
+        for offset in range(0, len(data), record.size):
+            yield record.unpack_from(data, offset)
+
+
+def read_trace(path, kind=None):
+    if kind is None:
+        kind = 'text' if path.lower().endswith(('.log', '.txt')) else 'binary'
+    return text_records(path) if kind == 'text' else binary_records(path)
+
+
+class Divergence:
+    __slots__ = ('index', 'expected', 'actual', 'history', 'following', 'halted')
+
+    def __init__(self, index, expected, actual, history, following, halted=False):
+        self.index = index          # instruction number, from 0
+        self.expected = expected
+        self.actual = actual
+        self.history = history      # matching records before it, oldest first
+        self.following = following  # the reference records after it
+        self.halted = halted        # the CPU stopped with reference records left
+
+    def fields(self):
+        return [name for name, want, got in zip(FIELDS, self.expected, self.actual) if want != got]
+
+    def report(self, lookup=None):
+        if self.halted:
+            lines = ['CPU halted before instruction {}; the reference goes on:'.format(self.index)]
+        else:
+            lines = ['diverged at instruction {} in {}:'.format(self.index, ', '.join(self.fields()))]
+        lines.extend('   ' + tracer.format_record(rec, lookup) for rec in self.history)
+        lines.append('-- ' + tracer.format_record(self.expected, lookup) + '   expected')
+        lines.append('++ ' + tracer.format_record(self.actual, lookup) + '   emulator')
+        lines.extend('   ' + tracer.format_record(rec, lookup) for rec in self.following)
+        return '\n'.join(lines)
+
+
+def cpu_record(cpu, cycle_offset):
+    # the CPU's state in reference record order, before the next instruction
+    return (cpu.pc & 0xFFFF, cpu.bus.ram[cpu.pc & 0xFFFF], cpu.a, cpu.x, cpu.y,
+            cpu.sp, cpu.p, cpu.clock_count + cpu.cycles + cycle_offset)
+
+
+def check(cpu, records, step=None, context=8, p_mask=0xFF, limit=None):
+    # returns None if the CPU follows every record (or the first `limit`),
+    # else a Divergence; halting with records left over is one too
+    step = cpu.step if step is None else step
+    history = collections.deque(maxlen=context)
+    cycle_offset = None
+    records = iter(records)
+    for index, expected in enumerate(records):
+        if limit is not None and index >= limit:
+            break
+        if cycle_offset is None:
+            cycle_offset = expected[7] - (cpu.clock_count + cpu.cycles)
+        actual = cpu_record(cpu, cycle_offset)
+        if actual[:6] != expected[:6] or (actual[6] ^ expected[6]) & p_mask or actual[7] != expected[7]:
+            following = [rec for _, rec in zip(range(context), records)]
+            return Divergence(index, expected, actual, list(history), following)
+        history.append(expected)
+        step()
+        if cpu.halt:
+            if limit is not None and index + 1 >= limit:
+                break
+            following = [rec for _, rec in zip(range(context + 1), records)]
+            if following:
+                return Divergence(index + 1, following[0], cpu_record(cpu, cycle_offset),
+                                  list(history), following[1:], halted=True)
+            break
+    return None
+
+
+def record(cpu, path, instructions, step=None):
+    # write a binary reference of the next instructions
+    step = cpu.step if step is None else step
+    trace = tracer.Tracer()
+    with open(path, 'wb') as f:
+        for _ in range(instructions):
+            if cpu.halt:
+                break
+            trace.record(*cpu_record(cpu, 0))
+            step()
+            if len(trace) == trace.capacity:
+                trace.drain(f)
+        trace.drain(f)
+
+
+def machine(args):
+    cpu = emu.CPU()
+    for spec in args.load:
+        # FILE or FILE:ADDRESS (where a raw image goes)
+        path, _, address = spec.partition(':')
+        loader.load_file(cpu, path, number(address) if address else 0)
+    cpu.reset()
+    if args.pc is not None:
+        cpu.pc = number(args.pc)
+    if args.p is not None:
+        cpu.p = number(args.p)
+    return cpu
+
+
+def stepper(cpu, engine):
+    if engine == 'interpreter':
+        return cpu.step
+    if engine == 'fastloop':
+        import fastloop
+        return lambda: fastloop.run(cpu, instructions=1)
+    raise ValueError('unknown engine {!r}'.format(engine))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='check the CPU against a reference trace')
+    parser.add_argument('trace', nargs='+', help='[record] TRACE')
+    parser.add_argument('--load', action='append', default=[], metavar='FILE[:ADDRESS]')
+    parser.add_argument('--pc', help='start address instead of the reset vector')
+    parser.add_argument('--p', help='initial status register')
+    parser.add_argument('--format', choices=('text', 'binary'), help='default: by extension')
+    parser.add_argument('--engine', default='interpreter', choices=('interpreter', 'fastloop'))
+    parser.add_argument('--context', type=int, default=8)
+    parser.add_argument('--ignore-flags', default='0', help='p bits not compared, e.g. $30 for B and U')
+    parser.add_argument('--limit', type=int, help='stop after this many instructions')
+    parser.add_argument('--instructions', type=int, default=1000000, help='how many to record')
+    args = parser.parse_args(argv)
+
+    cpu = machine(args)
+    step = stepper(cpu, args.engine)
+    if args.trace[0] == 'record' and len(args.trace) == 2:
+        record(cpu, args.trace[1], args.instructions, step)
+        return 0
+    if len(args.trace) != 1:
+        parser.error('expected TRACE or record TRACE')
+
+    divergence = check(cpu, read_trace(args.trace[0], args.format), step, args.context,
+                       0xFF & ~number(args.ignore_flags), args.limit)
+    if divergence is None:
+        print('trace matches')
+        return 0
+    print(divergence.report(cpu.lookup))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# instruction trace recorder
+# records are fixed width and written into a preallocated ring buffer,
+# so tracing costs one pack_into per instruction and never touches stdout.
+# drain() writes the buffered records to a file in one go.
+
+import struct
+
+# pc, opcode, a, x, y, sp, status byte, clock count at the start of the instruction
+RECORD = struct.Struct('<HBBBBBBQ')
+
+
+class Tracer:
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.count = 0      # records written since the last drain
+
+    def record(self, pc, opcode, a, x, y, sp, p, clock_count):
+        RECORD.pack_into(self.buffer, (self.count % self.capacity) * RECORD.size,
+                         pc & 0xFFFF, opcode, a & 0xFF, x & 0xFF, y & 0xFF,
+                         sp & 0xFF, p, clock_count)
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def raw(self):
+        # buffered records oldest first, as bytes
+        if self.count <= self.capacity:
+            return bytes(self.buffer[:self.count * RECORD.size])
+        split = (self.count % self.capacity) * RECORD.size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def records(self):
+        return list(RECORD.iter_unpack(self.raw()))
+
+    def drain(self, f):
+        # write the buffered records to an open binary file and empty the ring
+        data = self.raw()
+        f.write(data)
+        self.count = 0
+        return len(data) // RECORD.size
+
+    def clear(self):
+        self.count = 0
+
+
+def read_records(f):
+    # iterate over the records in a file written by Tracer.drain()
+    while True:
+        chunk = f.read(RECORD.size * 4096)
+        if not chunk:
+            break
+        yield from RECORD.iter_unpack(chunk)
+
+
+def format_record(rec, lookup=None):
+    pc, opcode, a, x, y, sp, p, clock_count = rec
+    name = lookup[opcode].name if lookup is not None else '{:02X}'.format(opcode)
+    return '{:04X}  {:02X} {}  A:{:02X} X:{:02X} Y:{:02X} P:{:02X} SP:{:02X}  CYC:{}'.format(
+        pc, opcode, name, a, x, y, p, sp, clock_count)
@@ -0,0 +1,183 @@
+# basic-block translation cache
+# decodes straight-line runs of 6502 code (up to a branch, jump, RTS/RTI or
+# BRK) into one generated Python function per block, with the addressing
+# mode and operator code inlined by codegen and the operand bytes baked in.
+# blocks are cached by start address. Each page holding translated code gets
+# a bus write hook, so a write over a block's bytes drops that block; a block
+# that overwrites its own code stops right after the offending instruction.
+# a block is handed the cycles left in the budget and returns early once an
+# instruction uses them up, so run(cycles) overshoots by at most one
+# instruction, the same as CPU.run().
+
+import codegen
+
+MAX_BLOCK = 64      # instructions per block
+
+
+def interpret(cpu, limit):
+    # stands in for a block where translation isn't possible
+    return cpu.step()
+
+
+class BlockTranslator:
+    def __init__(self, cpu, max_length=MAX_BLOCK):
+        self.cpu = cpu
+        self.bus = cpu.bus
+        self.max_length = max_length
+
+        self.blocks = {}        # start address -> block function
+        self.extent = {}        # start address -> (end address, alive flag)
+        self.page_blocks = {}   # page -> start addresses of blocks with bytes in it
+
+        # generated code runs with the globals of the methods it was made from
+        namespace = {}
+        for instruction in cpu.lookup:
+            namespace.update(instruction.addr_mode.__globals__)
+            namespace.update(instruction.operator.__globals__)
+        namespace['read'] = self.bus.read
+        namespace['write'] = self.bus.write
+        namespace['lookup'] = cpu.lookup
+        self.namespace = namespace
+
+    def run(self, cycles):
+        # like CPU.run(cycles=...) but dispatching a block at a time; the
+        # overshoot of the last instruction is carried in cpu.budget
+        cpu = self.cpu
+        if cpu.tracer is not None or cpu.profiler is not None:
+            return cpu.run(cycles=cycles)
+
+        budget = cpu.budget + cycles
+        dispatched = 0
+        if cpu.cycles and budget > 0 and not cpu.halt:
+            # owed cycles are charged along with the next instruction
+            budget -= cpu.step()
+            dispatched += 1
+
+        blocks = self.blocks
+        while budget > 0 and not cpu.halt:
+            block = blocks.get(cpu.pc)
+            if block is None:
+                block = self.translate(cpu.pc)
+            budget -= block(cpu, budget)
+            dispatched += 1
+        cpu.budget = budget
+        return dispatched
+
+    def translate(self, start):
+        # returns a callable block(cpu, limit) -> cycles that also advances
+        # cpu.clock_count; code the inliner can't handle, or code in device
+        # pages, falls back to the interpreter one instruction at a time
+        bus = self.bus
+        cpu_class = type(self.cpu)
+        if start > 0xFFFF or bus.read_pages[start >> 8] is not None:
+            return interpret
+
+        ram = bus.ram
+        touched = []    # addresses of the bytes baked into the instruction
+
+        def code(address):
+            touched.append(address)
+            return ram[address & 0xFFFF]
+
+        compiled = []
+        pc = start
+        end = start
+        while len(compiled) < self.max_length:
+            del touched[:]
+            try:
+                instruction = codegen.compile_instruction(cpu_class, code(pc), pc + 1, code)
+            except codegen.Unsupported:
+                break
+            if max(touched) > 0xFFFF or any(bus.read_pages[address >> 8] is not None
+                                            for address in touched):
+                break
+            compiled.append((pc, instruction))
+            end = max(end, max(touched) + 1)
+            if instruction.ends_block:
+                break
+            pc = instruction.next_pc
+
+        if not compiled:
+            self.blocks[start] = interpret
+            return interpret
+
+        alive = [True]
+        block = self.build(compiled, alive)
+
+        self.blocks[start] = block
+        self.extent[start] = (end, alive)
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            self.page_blocks.setdefault(page, set()).add(start)
+            bus.add_write_hook(page, self.code_written)
+        return block
+
+    def build(self, compiled, alive):
+        statements = [stmt for _, instruction in compiled for stmt in instruction.statements]
+        loaded, stored = codegen.used_registers(statements)
+        registers = sorted((loaded | stored) - {'cycles', 'pc'})
+        stored = sorted(stored - {'cycles', 'pc'})
+
+        def epilogue(pc, opcode, indent):
+            pad = ' ' * indent
+            lines = [pad + 'cpu.{0} = {0}'.format(name) for name in stored]
+            lines.append(pad + 'cpu.pc = {}'.format(pc))
+            lines.append(pad + 'cpu.opcode = {}'.format(opcode))
+            lines.append(pad + 'cpu.current_byte = lookup[{}]'.format(opcode))
+            lines.append(pad + 'cpu.clock_count += cycles')
+            lines.append(pad + 'return cycles')
+            return lines
+
+        start = compiled[0][0]
+        lines = ['def make_block(alive):',
+                 '  def block_{:04X}(cpu, limit):'.format(start)]
+        lines.extend('    {0} = cpu.{0}'.format(name) for name in registers)
+        lines.append('    cycles = 0')
+        for index, (pc, instruction) in enumerate(compiled):
+            lines.append('    # ${:04X} {} {}'.format(
+                pc, instruction.instruction.name, instruction.instruction.mode))
+            lines.append('    cycles += {}'.format(instruction.instruction.cycles))
+            lines.extend(instruction.source(4))
+            last = index == len(compiled) - 1
+            if not last:
+                # stop once the budget is spent, or when the write may have
+                # hit this block's own code
+                lines.append('    if cycles >= limit{}:'.format(' or not alive[0]' if instruction.writes else ''))
+                lines.extend(epilogue(instruction.next_pc, instruction.opcode, 6))
+        last = compiled[-1][1]
+        lines.extend(epilogue('pc' if last.next_pc is None else last.next_pc, last.opcode, 4))
+        lines.append('  return block_{:04X}'.format(start))
+
+        source = '\n'.join(lines)
+        namespace = dict(self.namespace)
+        exec(compile(source, '<block ${:04X}>'.format(start), 'exec'), namespace)
+        block = namespace['make_block'](alive)
+        block.source = source
+        return block
+
+    def code_written(self, address, data):
+        # bus write hook on pages holding translated code
+        page = address >> 8
+        starts = self.page_blocks.get(page)
+        if not starts:
+            return
+        for start in [s for s in starts if s <= address < self.extent[s][0]]:
+            self.drop(start)
+        if not starts:
+            self.bus.remove_write_hook(page, self.code_written)
+
+    def drop(self, start):
+        end, alive = self.extent.pop(start)
+        alive[0] = False
+        del self.blocks[start]
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            starts = self.page_blocks.get(page)
+            if starts is not None:
+                starts.discard(start)
+                if not starts:
+                    del self.page_blocks[page]
+                    self.bus.remove_write_hook(page, self.code_written)
+
+    def flush(self):
+        for start in list(self.extent):
+            self.drop(start)
+        self.blocks.clear()